@@ -0,0 +1,267 @@
+import os
+import sys
+import time
+import uuid
+import hashlib
+import argparse
+from pathlib import Path
+from typing import Any, Dict, Union
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+from sqlalchemy import create_engine, text
+
+from chainlit import make_async
+from chainlit.data.storage_clients.base import BaseStorageClient
+from chainlit.user import PersistedUser
+
+BLOB_ROOT = Path("blob_store")
+# URL prefix the stored elements are served from (see router below)
+URL_PREFIX = "/blobs/"
+READ_CHUNK_BYTES = 1024 * 1024
+# Untracked files younger than this may belong to an upload in progress
+GC_GRACE_SECONDS = 3600
+
+SCHEMA_DDL = [
+    """CREATE TABLE IF NOT EXISTS blobs (
+        "digest" TEXT PRIMARY KEY,
+        "size" INTEGER NOT NULL,
+        "refs" INTEGER NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS objects (
+        "objectKey" TEXT PRIMARY KEY,
+        "digest" TEXT NOT NULL REFERENCES blobs("digest"),
+        "mime" TEXT
+    )""",
+    """CREATE INDEX IF NOT EXISTS objects_digest ON objects ("digest")""",
+]
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(READ_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LocalBlobStorageClient(BaseStorageClient):
+    """Content-addressed local storage for Chainlit elements.
+
+    Each upload is stored under the SHA-256 of its content, so a file that
+    is attached again in another message or thread is stored only once.
+    Object keys map to digests in a small SQLite index that also keeps a
+    reference count per blob. A blob is removed when its last key is
+    deleted, and collect_garbage() clears anything left behind.
+    """
+
+    def __init__(self, root=BLOB_ROOT):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.engine = create_engine(f"sqlite:///{self.root / 'index.db'}")
+        with self.engine.begin() as conn:
+            for stmt in SCHEMA_DDL:
+                conn.execute(text(stmt))
+
+    def blob_path(self, digest):
+        return self.objects_dir / digest[:2] / digest
+
+    def _temp_path(self):
+        return self.objects_dir / f".tmp-{uuid.uuid4().hex}"
+
+    def _store_file(self, path, digest):
+        """Copy path into the store under digest unless it is already there."""
+        target = self.blob_path(digest)
+        if target.exists():
+            return
+        target.parent.mkdir(exist_ok=True)
+        temp = self._temp_path()
+        with open(path, "rb") as src, open(temp, "wb") as dst:
+            while chunk := src.read(READ_CHUNK_BYTES):
+                dst.write(chunk)
+        # Atomic, so readers never see a partially written blob
+        os.replace(temp, target)
+
+    def _link(self, object_key, digest, size, mime):
+        """Point object_key at digest and update reference counts."""
+        with self.engine.begin() as conn:
+            previous = conn.execute(
+                text("""SELECT "digest" FROM objects WHERE "objectKey" = :key"""), {"key": object_key}
+            ).scalar()
+            if previous == digest:
+                return
+            conn.execute(
+                text("""INSERT INTO blobs ("digest", "size", "refs") VALUES (:digest, :size, 1)
+                        ON CONFLICT ("digest") DO UPDATE SET "refs" = "refs" + 1"""),
+                {"digest": digest, "size": size},
+            )
+            conn.execute(
+                text("""INSERT INTO objects ("objectKey", "digest", "mime") VALUES (:key, :digest, :mime)
+                        ON CONFLICT ("objectKey") DO UPDATE SET "digest" = :digest, "mime" = :mime"""),
+                {"key": object_key, "digest": digest, "mime": mime},
+            )
+            if previous is not None:
+                self._release(conn, previous)
+
+    def _release(self, conn, digest):
+        conn.execute(text("""UPDATE blobs SET "refs" = "refs" - 1 WHERE "digest" = :digest"""), {"digest": digest})
+        refs = conn.execute(text("""SELECT "refs" FROM blobs WHERE "digest" = :digest"""), {"digest": digest}).scalar()
+        if refs is not None and refs <= 0:
+            conn.execute(text("""DELETE FROM blobs WHERE "digest" = :digest"""), {"digest": digest})
+            self.blob_path(digest).unlink(missing_ok=True)
+
+    def _result(self, object_key):
+        return {"object_key": object_key, "url": URL_PREFIX + object_key}
+
+    def sync_upload_path(self, object_key, path, mime="application/octet-stream"):
+        # Hashing first means a duplicate upload is only read, never copied.
+        # The reference is taken before the blob is written so a concurrent
+        # delete of the same content can't remove it underneath us.
+        digest = hash_file(path)
+        self._link(object_key, digest, os.path.getsize(path), mime)
+        self._store_file(path, digest)
+        return self._result(object_key)
+
+    def sync_upload_file(self, object_key, data, mime="application/octet-stream", overwrite=True):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        self._link(object_key, digest, len(data), mime)
+        target = self.blob_path(digest)
+        if not target.exists():
+            target.parent.mkdir(exist_ok=True)
+            temp = self._temp_path()
+            temp.write_bytes(data)
+            os.replace(temp, target)
+        return self._result(object_key)
+
+    async def upload_path(self, object_key: str, path: str, mime: str = "application/octet-stream") -> Dict[str, Any]:
+        """Stream a file from disk into the store without reading it into memory."""
+        return await make_async(self.sync_upload_path)(object_key, path, mime)
+
+    async def upload_file(
+        self,
+        object_key: str,
+        data: Union[bytes, str],
+        mime: str = "application/octet-stream",
+        overwrite: bool = True,
+    ) -> Dict[str, Any]:
+        return await make_async(self.sync_upload_file)(object_key, data, mime, overwrite)
+
+    def sync_delete_file(self, object_key):
+        with self.engine.begin() as conn:
+            digest = conn.execute(
+                text("""SELECT "digest" FROM objects WHERE "objectKey" = :key"""), {"key": object_key}
+            ).scalar()
+            if digest is None:
+                return False
+            conn.execute(text("""DELETE FROM objects WHERE "objectKey" = :key"""), {"key": object_key})
+            self._release(conn, digest)
+        return True
+
+    async def delete_file(self, object_key: str) -> bool:
+        return await make_async(self.sync_delete_file)(object_key)
+
+    async def get_read_url(self, object_key: str) -> str:
+        return URL_PREFIX + object_key
+
+    def lookup(self, object_key):
+        """Return (path, mime) for an object key, or None."""
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                text("""SELECT "digest", "mime" FROM objects WHERE "objectKey" = :key"""), {"key": object_key}
+            ).first()
+        if row is None:
+            return None
+        return self.blob_path(row[0]), row[1]
+
+    def collect_garbage(self):
+        """Remove unreferenced blobs and stray files. Returns (files, bytes) freed."""
+        freed_files = freed_bytes = 0
+        with self.engine.begin() as conn:
+            # Blobs whose reference count drifted from the objects table
+            conn.execute(text("""
+                UPDATE blobs SET "refs" = (SELECT COUNT(*) FROM objects o WHERE o."digest" = blobs."digest")
+            """))
+            for digest, size in conn.execute(text("""SELECT "digest", "size" FROM blobs WHERE "refs" <= 0""")).all():
+                path = self.blob_path(digest)
+                if path.exists():
+                    path.unlink()
+                    freed_files += 1
+                    freed_bytes += size
+            conn.execute(text("""DELETE FROM blobs WHERE "refs" <= 0"""))
+            known = {row[0] for row in conn.execute(text("""SELECT "digest" FROM blobs"""))}
+
+        cutoff = time.time() - GC_GRACE_SECONDS
+        for path in self.objects_dir.rglob("*"):
+            if path.is_file() and path.name not in known and path.stat().st_mtime < cutoff:
+                freed_bytes += path.stat().st_size
+                freed_files += 1
+                path.unlink()
+        return freed_files, freed_bytes
+
+    def stats(self):
+        with self.engine.connect() as conn:
+            blobs, stored_bytes = conn.execute(text("""SELECT COUNT(*), COALESCE(SUM("size"), 0) FROM blobs""")).one()
+            objects, logical_bytes = conn.execute(text("""
+                SELECT COUNT(*), COALESCE(SUM(b."size"), 0) FROM objects o JOIN blobs b ON b."digest" = o."digest"
+            """)).one()
+        return {"objects": objects, "blobs": blobs, "logical_bytes": logical_bytes, "stored_bytes": stored_bytes}
+
+
+def create_router(storage_client):
+    """Routes serving stored elements to their owner."""
+    from chainlit.data import get_data_layer
+    from chainlit.server import UserParam
+
+    router = APIRouter()
+
+    @router.get(URL_PREFIX + "{object_key:path}")
+    async def get_blob(object_key: str, current_user: UserParam):
+        if not current_user:
+            raise HTTPException(status_code=401, detail="Unauthorized")
+        # Object keys created by SQLAlchemyDataLayer start with the owner's user id
+        user = current_user
+        if not isinstance(user, PersistedUser):
+            user = await get_data_layer().get_user(identifier=current_user.identifier)
+        if user is None or object_key.split("/", 1)[0] != user.id:
+            raise HTTPException(status_code=401, detail="Unauthorized")
+
+        found = await make_async(storage_client.lookup)(object_key)
+        if found is None or not found[0].exists():
+            raise HTTPException(status_code=404, detail="Not found")
+        path, mime = found
+        # FileResponse streams straight from the file (with range support)
+        # instead of loading the blob into memory. The explicit encoding keeps
+        # the gzip middleware from recompressing large binaries.
+        return FileResponse(
+            path,
+            media_type=mime,
+            filename=object_key.rsplit("/", 1)[-1],
+            headers={"Content-Encoding": "identity"},
+        )
+
+    return router
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Maintain the local element blob store")
+    parser.add_argument("command", choices=["gc", "stats"])
+    parser.add_argument("--root", default=str(BLOB_ROOT))
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    client = LocalBlobStorageClient(args.root)
+    if args.command == "gc":
+        files, freed = client.collect_garbage()
+        print(f"Removed {files} files, freed {freed / 2**20:.1f} MB")
+    elif args.command == "stats":
+        s = client.stats()
+        saved = s["logical_bytes"] - s["stored_bytes"]
+        print(f"{s['objects']} objects in {s['blobs']} blobs, "
+              f"{s['stored_bytes'] / 2**20:.1f} MB stored, {saved / 2**20:.1f} MB saved by deduplication")
+    else:
+        sys.exit(1)
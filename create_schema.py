@@ -1,5 +1,7 @@
 from sqlalchemy import create_engine, text
 
+import rollups
+
 engine = create_engine("sqlite:///chainlit_db.db")
 
 TABLES_DDL = """
@@ -74,14 +76,30 @@ CREATE TABLE IF NOT EXISTS feedbacks (
 );
 """.strip()
 
-if __name__ == "__main__":
-    with engine.connect() as conn:
-        # Split on semicolons so that each statement can be executed individually
-        statements = TABLES_DDL.split(";")
+# Secondary indexes for the common access paths: a user's threads newest first,
+# and a thread's steps in order. Kept separate from TABLES_DDL so bulk loaders
+# can drop them before inserting and rebuild them once at the end.
+INDEXES_DDL = """
+CREATE INDEX IF NOT EXISTS threads_user_created ON threads ("userId", "createdAt", "id");
+CREATE INDEX IF NOT EXISTS steps_thread_created ON steps ("threadId", "createdAt");
+CREATE INDEX IF NOT EXISTS feedbacks_for ON feedbacks ("forId")
+""".strip()
+
+INDEX_NAMES = ["threads_user_created", "steps_thread_created", "feedbacks_for"]
 
-        for stmt in statements:
-            # Clean up whitespace/newlines
-            stmt = stmt.strip()
-            if stmt:
-                conn.execute(text(stmt))
+
+def execute_script(conn, script):
+    # Split on semicolons so that each statement can be executed individually
+    for stmt in script.split(";"):
+        # Clean up whitespace/newlines
+        stmt = stmt.strip()
+        if stmt:
+            conn.execute(text(stmt))
+
+
+if __name__ == "__main__":
+    with engine.begin() as conn:
+        execute_script(conn, TABLES_DDL)
+        execute_script(conn, INDEXES_DDL)
+        rollups.install(conn)
         print("Database schema created (or already exists).")
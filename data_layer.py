@@ -0,0 +1,494 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from chainlit.data.sql_alchemy import SQLAlchemyDataLayer
+from chainlit.data.utils import queue_until_user_message
+from chainlit.step import StepDict
+from chainlit.types import (
+    FeedbackDict,
+    PageInfo,
+    PaginatedResponse,
+    Pagination,
+    ThreadDict,
+    ThreadFilter,
+)
+from chainlit.user import PersistedUser, User
+from sqlalchemy import text
+
+# Cursors handed to the UI are "<createdAt>|<id>" so the next page can seek
+# straight to its position in the threads_user_created index.
+CURSOR_SEPARATOR = "|"
+
+# Number of most recent steps sent in full when a thread is opened. Older
+# steps are sent as previews of STUB_OUTPUT_CHARS with a link that loads the
+# full step (thread_api.py, public/thread_loader.js). Chainlit sends a
+# resumed thread over socket.io, where the GZip middleware doesn't apply.
+STEP_WINDOW = 100
+STUB_OUTPUT_CHARS = 300
+FULL_STEP_LINK = "#full-step-"
+
+# Version counter bumped by triggers on every write to users or threads, from
+# any process: other serve.py workers, import_history.py, manual edits. A
+# change means the in-process caches below may be stale.
+EPOCH_DDL = [
+    """CREATE TABLE IF NOT EXISTS cache_epoch (
+        "id" INTEGER PRIMARY KEY CHECK ("id" = 1),
+        "version" INTEGER NOT NULL
+    )""",
+    """INSERT OR IGNORE INTO cache_epoch ("id", "version") VALUES (1, 0)""",
+] + [
+    f"""CREATE TRIGGER IF NOT EXISTS cache_epoch_{table}_{event.lower()} AFTER {event} ON {table} BEGIN
+        UPDATE cache_epoch SET "version" = "version" + 1 WHERE "id" = 1;
+    END"""
+    for table in ("users", "threads")
+    for event in ("INSERT", "UPDATE", "DELETE")
+]
+# How stale a cached user or sidebar page can be after another process
+# changed it; also bounds how often the epoch is read.
+EPOCH_CHECK_SECONDS = 1.0
+
+STEP_COLUMNS = """
+    s."id" AS step_id,
+    s."name" AS step_name,
+    s."type" AS step_type,
+    s."threadId" AS step_threadid,
+    s."parentId" AS step_parentid,
+    s."streaming" AS step_streaming,
+    s."waitForAnswer" AS step_waitforanswer,
+    s."isError" AS step_iserror,
+    s."metadata" AS step_metadata,
+    s."tags" AS step_tags,
+    s."input" AS step_input,
+    s."output" AS step_output,
+    s."createdAt" AS step_createdat,
+    s."start" AS step_start,
+    s."end" AS step_end,
+    s."showInput" AS step_showinput,
+    s."language" AS step_language,
+    f."value" AS feedback_value,
+    f."comment" AS feedback_comment,
+    f."id" AS feedback_id
+"""
+# Same columns for an older step: no input, output cut to a preview
+STUB_COLUMNS = STEP_COLUMNS.replace(
+    's."input" AS step_input,', "'' AS step_input,"
+).replace(
+    's."output" AS step_output,',
+    'substr(s."output", 1, :stub_chars) AS step_output, length(s."output") AS step_output_length,',
+)
+
+
+class LRUCache:
+    """Small least-recently-used map. Not thread safe; the data layer only
+    runs on Chainlit's event loop."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+
+    def get(self, key, default=None):
+        if key not in self._items:
+            return default
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def pop(self, key):
+        self._items.pop(key, None)
+
+    def pop_where(self, predicate):
+        for key in [k for k in self._items if predicate(k)]:
+            del self._items[key]
+
+    def clear(self):
+        self._items.clear()
+
+
+def encode_cursor(row):
+    return f"{row['createdAt']}{CURSOR_SEPARATOR}{row['id']}"
+
+
+def decode_cursor(cursor):
+    created_at, row_id = cursor.rsplit(CURSOR_SEPARATOR, 1)
+    return created_at, row_id
+
+
+def row_to_step(row):
+    # Same mapping as SQLAlchemyDataLayer.get_all_user_threads, minus the
+    # generation payload which is left for get_step_generation.
+    feedback = None
+    if row["feedback_value"] is not None:
+        feedback = FeedbackDict(
+            forId=row["step_id"],
+            id=row.get("feedback_id"),
+            value=row["feedback_value"],
+            comment=row.get("feedback_comment"),
+        )
+    return StepDict(
+        id=row["step_id"],
+        name=row["step_name"],
+        type=row["step_type"],
+        threadId=row["step_threadid"],
+        parentId=row.get("step_parentid"),
+        streaming=row.get("step_streaming", False),
+        waitForAnswer=row.get("step_waitforanswer"),
+        isError=row.get("step_iserror"),
+        metadata=row["step_metadata"] if row.get("step_metadata") is not None else {},
+        tags=row.get("step_tags"),
+        input=(
+            row.get("step_input", "")
+            if row.get("step_showinput") not in [None, "false"]
+            else ""
+        ),
+        output=row.get("step_output", ""),
+        createdAt=row.get("step_createdat"),
+        start=row.get("step_start"),
+        end=row.get("step_end"),
+        generation=None,
+        showInput=row.get("step_showinput"),
+        language=row.get("step_language"),
+        feedback=feedback,
+    )
+
+
+def stub_output(step_id, preview):
+    """A cut-off output that renders as Markdown, followed by the link to the full step."""
+    preview = preview.rstrip() + "…"
+    # Close a code block left open by the cut, or it would swallow the link
+    if preview.count("```") % 2:
+        preview += "\n```"
+    return f"{preview}\n\n[Show full message]({FULL_STEP_LINK}{step_id})"
+
+
+class CachedDataLayer(SQLAlchemyDataLayer):
+    """SQLAlchemyDataLayer with in-process caches and keyset thread pagination.
+
+    The stock list_threads loads every thread of the user together with all
+    their steps and then slices the list in Python, so each sidebar page costs
+    as much as the user's entire history. Here each page is a single indexed
+    query for exactly the rows shown, and unfiltered pages, users and thread
+    authors are cached until a write touches them. Writes made by other
+    processes are noticed through the cache_epoch counter (SQLite only).
+    """
+
+    def __init__(self, *args, user_cache_size=1024, page_cache_size=4096, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._users = LRUCache(user_cache_size)
+        # (user_id, cursor, first) -> PaginatedResponse
+        self._thread_pages = LRUCache(page_cache_size)
+        # thread_id -> (user_id, user_identifier)
+        self._thread_owners = LRUCache(page_cache_size * 4)
+        self._epoch = None
+        self._epoch_checked_at = float("-inf")
+        self._epoch_installed = False
+
+    async def _check_epoch(self):
+        """Drop every cache if another process may have written since the last check."""
+        if self.engine.dialect.name != "sqlite":
+            return
+        now = time.monotonic()
+        if now - self._epoch_checked_at < EPOCH_CHECK_SECONDS:
+            return
+        self._epoch_checked_at = now
+        if not self._epoch_installed:
+            for stmt in EPOCH_DDL:
+                await self.execute_sql(query=stmt, parameters={})
+            self._epoch_installed = True
+        result = await self.execute_sql(query="""SELECT "version" FROM cache_epoch WHERE "id" = 1""", parameters={})
+        version = result[0]["version"] if isinstance(result, list) and result else None
+        # An unreadable counter (None) never matches, so nothing stays cached
+        if version is None or version != self._epoch:
+            self._users.clear()
+            self._thread_pages.clear()
+            self._thread_owners.clear()
+        self._epoch = version
+
+    ###### Users ######
+    async def get_user(self, identifier: str) -> Optional[PersistedUser]:
+        await self._check_epoch()
+        user = self._users.get(identifier)
+        if user is None:
+            user = await super().get_user(identifier)
+            if user is not None:
+                self._users.put(identifier, user)
+        return user
+
+    async def create_user(self, user: User) -> Optional[PersistedUser]:
+        self._users.pop(user.identifier)
+        return await super().create_user(user)
+
+    ###### Threads ######
+    def _invalidate_thread(self, thread_id, user_id=None):
+        owner = self._thread_owners.get(thread_id)
+        if user_id is None and owner is not None:
+            user_id = owner[0]
+        self._thread_owners.pop(thread_id)
+        if user_id is None:
+            # Unknown owner (e.g. a brand new thread): drop every cached page
+            self._thread_pages.clear()
+        else:
+            self._thread_pages.pop_where(lambda key: key[0] == user_id)
+
+    async def get_thread_author(self, thread_id: str) -> str:
+        await self._check_epoch()
+        owner = self._thread_owners.get(thread_id)
+        if owner is not None and owner[1] is not None:
+            return owner[1]
+        return await super().get_thread_author(thread_id)
+
+    async def update_thread(self, thread_id: str, name=None, user_id=None, metadata=None, tags=None):
+        await super().update_thread(thread_id, name=name, user_id=user_id, metadata=metadata, tags=tags)
+        self._invalidate_thread(thread_id, user_id)
+
+    async def delete_thread(self, thread_id: str):
+        await super().delete_thread(thread_id)
+        self._invalidate_thread(thread_id)
+
+    async def _cursor_position(self, cursor):
+        if CURSOR_SEPARATOR in cursor:
+            return decode_cursor(cursor)
+        # Plain thread id, as issued by the stock data layer
+        result = await self.execute_sql(
+            query="""SELECT "createdAt" FROM threads WHERE "id" = :id""",
+            parameters={"id": cursor},
+        )
+        if isinstance(result, list) and result:
+            return result[0]["createdAt"], cursor
+        return None
+
+    async def list_threads(self, pagination: Pagination, filters: ThreadFilter) -> PaginatedResponse:
+        if not filters.userId:
+            raise ValueError("userId is required")
+
+        # Search and feedback filters depend on step contents, which change on
+        # every message, so only the plain sidebar listing is cached.
+        cacheable = not filters.search and filters.feedback is None
+        cache_key = (filters.userId, pagination.cursor, pagination.first)
+        if cacheable:
+            await self._check_epoch()
+            cached = self._thread_pages.get(cache_key)
+            if cached is not None:
+                return cached
+
+        conditions = ['t."userId" = :user_id']
+        parameters: Dict = {"user_id": filters.userId, "limit": pagination.first + 1}
+        if pagination.cursor:
+            position = await self._cursor_position(pagination.cursor)
+            if position is not None:
+                conditions.append(
+                    '(t."createdAt" < :cursor_created OR (t."createdAt" = :cursor_created AND t."id" < :cursor_id))'
+                )
+                parameters["cursor_created"], parameters["cursor_id"] = position
+        if filters.search:
+            conditions.append(
+                """EXISTS (SELECT 1 FROM steps s WHERE s."threadId" = t."id" AND lower(s."output") LIKE :search)"""
+            )
+            parameters["search"] = f"%{filters.search.lower()}%"
+        if filters.feedback is not None:
+            conditions.append(
+                """EXISTS (SELECT 1 FROM steps s JOIN feedbacks f ON f."forId" = s."id"
+                   WHERE s."threadId" = t."id" AND f."value" = :feedback)"""
+            )
+            parameters["feedback"] = int(filters.feedback)
+
+        query = f"""
+            SELECT t."id", t."createdAt", t."name", t."userId", t."userIdentifier", t."tags", t."metadata"
+            FROM threads t
+            WHERE {" AND ".join(conditions)}
+            ORDER BY t."createdAt" DESC, t."id" DESC
+            LIMIT :limit
+        """
+        rows = await self.execute_sql(query=query, parameters=parameters)
+        rows = rows if isinstance(rows, list) else []
+
+        has_next_page = len(rows) > pagination.first
+        threads: List[ThreadDict] = [
+            ThreadDict(
+                id=row["id"],
+                createdAt=row["createdAt"],
+                name=row["name"],
+                userId=row["userId"],
+                userIdentifier=row["userIdentifier"],
+                tags=row["tags"],
+                metadata=row["metadata"],
+                steps=[],
+                elements=[],
+            )
+            for row in rows[: pagination.first]
+        ]
+        for thread in threads:
+            self._thread_owners.put(thread["id"], (thread["userId"], thread["userIdentifier"]))
+
+        response = PaginatedResponse(
+            pageInfo=PageInfo(
+                hasNextPage=has_next_page,
+                startCursor=encode_cursor(threads[0]) if threads else None,
+                endCursor=encode_cursor(threads[-1]) if threads else None,
+            ),
+            data=threads,
+        )
+        if cacheable:
+            self._thread_pages.put(cache_key, response)
+        return response
+
+    ###### Steps ######
+    async def _select(self, query: str, parameters: Dict) -> List[Dict]:
+        # execute_sql cleans every value of every row recursively, which
+        # takes longer than the query itself on threads with thousands of steps
+        async with self.engine.connect() as conn:
+            result = await conn.execute(text(query), parameters)
+            return [dict(row) for row in result.mappings()]
+
+    async def get_steps_page(self, thread_id: str, before: Optional[str] = None, limit: Optional[int] = STEP_WINDOW,
+                             stub_chars: Optional[int] = None):
+        """Return up to `limit` steps of a thread older than the `before` cursor.
+
+        Steps come back oldest first, with the cursor to pass as `before` for
+        the next (older) page, or None once the start of the thread is reached.
+        A `limit` of None returns all of them. With `stub_chars`, outputs longer
+        than that are cut to a preview (see stub_output) and inputs are left out.
+        """
+        conditions = ['s."threadId" = :thread_id']
+        parameters: Dict = {"thread_id": thread_id}
+        if stub_chars is not None:
+            parameters["stub_chars"] = stub_chars
+        if before:
+            conditions.append(
+                '(s."createdAt" < :before_created OR (s."createdAt" = :before_created AND s."id" < :before_id))'
+            )
+            parameters["before_created"], parameters["before_id"] = decode_cursor(before)
+        query = f"""
+            SELECT {STEP_COLUMNS if stub_chars is None else STUB_COLUMNS}
+            FROM steps s LEFT JOIN feedbacks f ON s."id" = f."forId"
+            WHERE {" AND ".join(conditions)}
+            ORDER BY s."createdAt" DESC, s."id" DESC
+        """
+        if limit is not None:
+            # One extra row tells whether an older page exists
+            query += " LIMIT :limit"
+            parameters["limit"] = limit + 1
+        rows = await self._select(query, parameters)
+
+        has_older = limit is not None and len(rows) > limit
+        steps = [row_to_step(row) for row in reversed(rows[:limit])]
+        if stub_chars is not None:
+            for step, row in zip(steps, reversed(rows[:limit])):
+                if (row["step_output_length"] or 0) > stub_chars:
+                    step["output"] = stub_output(step["id"], step["output"])
+        older_cursor = encode_cursor(steps[0]) if has_older else None
+        return steps, older_cursor
+
+    async def get_step(self, thread_id: str, step_id: str):
+        """One step in full, generation included, as linked from a preview."""
+        result = await self._select(
+            f"""
+                SELECT {STEP_COLUMNS}, s."generation" AS step_generation
+                FROM steps s LEFT JOIN feedbacks f ON s."id" = f."forId"
+                WHERE s."threadId" = :thread_id AND s."id" = :id
+            """,
+            {"thread_id": thread_id, "id": step_id},
+        )
+        if not result:
+            return None
+        step = row_to_step(result[0])
+        generation = result[0]["step_generation"]
+        step["generation"] = json.loads(generation) if isinstance(generation, str) else generation
+        return step
+
+    async def get_thread_messages(self, thread_id: str):
+        """Type and output of every root step, for rebuilding conversation memory."""
+        result = await self.execute_sql(
+            query="""
+                SELECT "type", "output" FROM steps
+                WHERE "threadId" = :thread_id AND "parentId" IS NULL
+                ORDER BY "createdAt", "id"
+            """,
+            parameters={"thread_id": thread_id},
+        )
+        return result if isinstance(result, list) else []
+
+    async def get_thread(self, thread_id: str) -> Optional[ThreadDict]:
+        """Load a thread with its latest STEP_WINDOW steps in full and older ones as previews.
+
+        The stock implementation ships every step in full, generation payload
+        included, which the UI never shows. Older steps keep their place in
+        the conversation but long outputs are cut to a preview linking to
+        get_step.
+        """
+        result = await self.execute_sql(
+            query="""
+                SELECT "id", "createdAt", "name", "userId", "userIdentifier", "tags", "metadata"
+                FROM threads WHERE "id" = :id
+            """,
+            parameters={"id": thread_id},
+        )
+        if not isinstance(result, list) or not result:
+            return None
+        row = result[0]
+
+        steps, older_cursor = await self.get_steps_page(thread_id, limit=STEP_WINDOW)
+        if older_cursor:
+            older, _ = await self.get_steps_page(
+                thread_id, before=older_cursor, limit=None, stub_chars=STUB_OUTPUT_CHARS
+            )
+            steps = older + steps
+        elements_query = """
+            SELECT "id", "threadId", "type", "chainlitKey", "url", "objectKey", "name",
+                   "display", "size", "language", "page", "forId", "mime"
+            FROM elements WHERE "threadId" = :thread_id
+        """
+        elements = await self.execute_sql(query=elements_query, parameters={"thread_id": thread_id})
+
+        metadata = row["metadata"]
+        if isinstance(metadata, str):
+            metadata = json.loads(metadata)
+
+        thread = ThreadDict(
+            id=row["id"],
+            createdAt=row["createdAt"],
+            name=row["name"],
+            userId=row["userId"],
+            userIdentifier=row["userIdentifier"],
+            tags=row["tags"],
+            metadata=metadata or {},
+            steps=steps,
+            elements=[{**e, "props": {}} for e in elements] if isinstance(elements, list) else [],
+        )
+        return thread
+
+    ###### Elements ######
+    @queue_until_user_message()
+    async def create_element(self, element):
+        """Stream file-backed elements into storage providers that support it.
+
+        The stock implementation reads the whole file into memory first, which
+        for 500 MB uploads means 500 MB per attachment held by the server.
+        """
+        if not (element.path and element.for_id and hasattr(self.storage_provider, "upload_path")):
+            return await super().create_element(element)
+
+        user_id: str = await self._get_user_id_by_thread(element.thread_id) or "unknown"
+        object_key = f"{user_id}/{element.id}" + (f"/{element.name}" if element.name else "")
+        if not element.mime:
+            element.mime = "application/octet-stream"
+
+        uploaded_file = await self.storage_provider.upload_path(object_key, element.path, element.mime)
+
+        element_dict = element.to_dict()
+        element_dict["url"] = uploaded_file.get("url")
+        element_dict["objectKey"] = uploaded_file.get("object_key")
+        element_dict_cleaned = {k: v for k, v in element_dict.items() if v is not None}
+        if "props" in element_dict_cleaned:
+            element_dict_cleaned["props"] = json.dumps(element_dict_cleaned["props"])
+
+        columns = ", ".join(f'"{column}"' for column in element_dict_cleaned.keys())
+        placeholders = ", ".join(f":{column}" for column in element_dict_cleaned.keys())
+        query = f"INSERT INTO elements ({columns}) VALUES ({placeholders})"
+        await self.execute_sql(query=query, parameters=element_dict_cleaned)
@@ -0,0 +1,301 @@
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+from itertools import islice
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import create_engine, text
+
+from create_schema import TABLES_DDL, INDEXES_DDL, INDEX_NAMES, execute_script
+
+READ_BLOCK_CHARS = 64 * 1024
+# Rows written per transaction. SQLite pays one fsync per commit, so large
+# batches are what make the import fast.
+BATCH_ROWS = 50000
+# Files larger than this are streamed by the writer in batches instead of
+# being parsed whole in a worker and sent back as one pickle.
+LARGE_FILE_BYTES = 16 * 1024 * 1024
+# Thread and step ids are derived from the file path so re-running an import
+# over the same files doesn't create duplicates.
+ID_NAMESPACE = uuid.UUID("4f0c8f6e-3b7a-4d0e-9a57-2d7f4b1c9e10")
+ASSISTANT_NAME = "Assistant"
+THREAD_NAME_CHARS = 60
+
+INSERT_THREAD = text("""
+INSERT OR IGNORE INTO threads ("id", "createdAt", "name", "userId", "userIdentifier", "metadata")
+VALUES (:id, :createdAt, :name, :userId, :userIdentifier, :metadata)
+""")
+
+INSERT_STEP = text("""
+INSERT OR IGNORE INTO steps ("id", "name", "type", "threadId", "parentId", "streaming",
+    "waitForAnswer", "isError", "metadata", "input", "output", "createdAt", "start", "end",
+    "generation", "showInput")
+VALUES (:id, :name, :type, :threadId, NULL, 0, 0, 0, '{}', '', :output, :createdAt,
+    :createdAt, :createdAt, '{}', NULL)
+""")
+
+
+def iter_json_array(path):
+    """Yield the elements of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = ""
+        position = 0
+        started = False
+        eof = False
+        read_chars = READ_BLOCK_CHARS
+        while True:
+            # Skip whitespace and the array punctuation between elements
+            while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+                if buffer[position] == "[":
+                    started = True
+                position += 1
+            if position < len(buffer):
+                if not started:
+                    raise ValueError(f"{path} does not contain a JSON array")
+                try:
+                    item, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    # The element is cut off at the end of the buffer. Read at
+                    # least as much again as it already spans, so a huge element
+                    # is decoded a logarithmic number of times, not once per block.
+                    if eof:
+                        raise
+                    read_chars = max(READ_BLOCK_CHARS, len(buffer) - position)
+                else:
+                    yield item
+                    position = end
+                    read_chars = READ_BLOCK_CHARS
+                    continue
+            if eof:
+                return
+            block = f.read(read_chars)
+            eof = not block
+            buffer = buffer[position:] + block
+            position = 0
+
+
+def iso_timestamp(dt):
+    # Same shape Chainlit writes: naive ISO time with a trailing Z
+    return dt.replace(tzinfo=None).isoformat() + "Z"
+
+
+def iter_file_rows(path, user_id, user_identifier, lookahead=BATCH_ROWS):
+    """Map one legacy history file to its thread row, then its step rows, lazily.
+
+    The thread is named after the first user message within the first
+    `lookahead` steps, which are held back until it is known.
+    """
+    path = Path(path).resolve()
+    thread_id = str(uuid.uuid5(ID_NAMESPACE, str(path)))
+    # Legacy files carry no timestamps; anchor the thread at the file's mtime
+    # and space the messages a millisecond apart to keep their order.
+    created = datetime.fromtimestamp(path.stat().st_mtime, tz=timezone.utc)
+
+    steps = iter_step_rows(path, thread_id, created, user_identifier)
+    held = []
+    name = None
+    for step in steps:
+        held.append(step)
+        if step["type"] == "user_message":
+            name = step["output"][:THREAD_NAME_CHARS]
+        if name is not None or len(held) >= lookahead:
+            break
+
+    yield {
+        "id": thread_id,
+        "createdAt": iso_timestamp(created),
+        "name": name or path.stem,
+        "userId": user_id,
+        "userIdentifier": user_identifier,
+        "metadata": json.dumps({"importedFrom": str(path)}),
+    }
+    yield from held
+    yield from steps
+
+
+def iter_step_rows(path, thread_id, created, user_identifier):
+    for i, message in enumerate(iter_json_array(path)):
+        if not isinstance(message, dict):
+            raise ValueError(f"entry {i} is not a {{role, content}} object")
+        role = message.get("role")
+        content = message.get("content") or ""
+        if not isinstance(content, str):
+            content = json.dumps(content)
+        if role == "user":
+            step_type, step_name = "user_message", user_identifier
+        elif role == "assistant":
+            step_type, step_name = "assistant_message", ASSISTANT_NAME
+        else:
+            continue
+        yield {
+            "id": str(uuid.uuid5(ID_NAMESPACE, f"{thread_id}/{i}")),
+            "name": step_name,
+            "type": step_type,
+            "threadId": thread_id,
+            "output": content,
+            "createdAt": iso_timestamp(created + timedelta(milliseconds=i)),
+        }
+
+
+def file_to_rows(path, user_id, user_identifier):
+    """Map one legacy history file to a thread row and the list of its step rows."""
+    rows = iter_file_rows(path, user_id, user_identifier)
+    thread = next(rows)
+    return thread, list(rows)
+
+
+def _file_to_rows_job(args):
+    # Top-level wrapper so the worker processes can pickle the call
+    path, user_id, user_identifier = args
+    try:
+        return str(path), file_to_rows(path, user_id, user_identifier), None
+    except Exception as e:
+        # One bad file shouldn't abort the whole import
+        return str(path), None, f"{type(e).__name__}: {e}"
+
+
+def get_or_create_user(conn, identifier):
+    row = conn.execute(text("SELECT id FROM users WHERE identifier = :identifier"),
+                       {"identifier": identifier}).first()
+    if row:
+        return row[0]
+    user_id = str(uuid.uuid4())
+    conn.execute(
+        text("""INSERT INTO users ("id", "identifier", "createdAt", "metadata") VALUES (:id, :identifier, :createdAt, :metadata)"""),
+        {"id": user_id, "identifier": identifier,
+         "createdAt": iso_timestamp(datetime.now(timezone.utc)), "metadata": "{}"},
+    )
+    return user_id
+
+
+def expand_paths(paths):
+    for p in map(Path, paths):
+        if p.is_dir():
+            yield from sorted(p.rglob("*.json"))
+        else:
+            yield p
+
+
+def import_files(paths, database="chainlit_db.db", user_identifier="test", workers=None):
+    """Import legacy history files into the Chainlit database.
+
+    Files are parsed in parallel worker processes; a single writer (SQLite
+    allows only one) inserts their rows in batches of BATCH_ROWS. Files over
+    LARGE_FILE_BYTES are streamed by the writer itself, one batch at a time,
+    in a transaction of their own. Secondary indexes are dropped for the
+    duration and rebuilt once at the end, also when the import fails part way.
+    """
+    files = list(expand_paths(paths))
+    large_files = [path for path in files if path.stat().st_size > LARGE_FILE_BYTES]
+    small_files = [path for path in files if path.stat().st_size <= LARGE_FILE_BYTES]
+    engine = create_engine(f"sqlite:///{database}")
+    with engine.begin() as conn:
+        execute_script(conn, TABLES_DDL)
+        user_id = get_or_create_user(conn, user_identifier)
+        for name in INDEX_NAMES:
+            conn.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+
+    threads, steps = [], []
+    imported_files = imported_rows = 0
+    failed = []
+    started = time.perf_counter()
+
+    def flush(conn):
+        nonlocal threads, steps, imported_rows
+        # Threads first so the steps' foreign keys resolve within the batch
+        if threads:
+            conn.execute(INSERT_THREAD, threads)
+        if steps:
+            conn.execute(INSERT_STEP, steps)
+        imported_rows += len(threads) + len(steps)
+        threads, steps = [], []
+
+    def import_large_file(conn, path):
+        nonlocal imported_files, imported_rows
+        # Called with nothing pending, so a failure only rolls back this file
+        written = 0
+        try:
+            rows = iter_file_rows(path, user_id, user_identifier)
+            conn.execute(INSERT_THREAD, [next(rows)])
+            written += 1
+            while batch := list(islice(rows, BATCH_ROWS)):
+                conn.execute(INSERT_STEP, batch)
+                written += len(batch)
+                # Let it go before the next batch is built, or both are held
+                del batch
+        except Exception as e:
+            conn.rollback()
+            failed.append((str(path), f"{type(e).__name__}: {e}"))
+            return
+        conn.commit()
+        imported_files += 1
+        imported_rows += written
+
+    try:
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+            conn.exec_driver_sql("PRAGMA synchronous=NORMAL")
+            conn.exec_driver_sql("PRAGMA temp_store=MEMORY")
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                jobs = ((path, user_id, user_identifier) for path in small_files)
+                for path, rows, error in pool.map(_file_to_rows_job, jobs, chunksize=16):
+                    if error:
+                        failed.append((path, error))
+                        continue
+                    thread, thread_steps = rows
+                    threads.append(thread)
+                    steps.extend(thread_steps)
+                    imported_files += 1
+                    if len(threads) + len(steps) >= BATCH_ROWS:
+                        flush(conn)
+                        conn.commit()
+                        elapsed = time.perf_counter() - started
+                        print(f"{imported_files}/{len(files)} files, {imported_rows} rows, "
+                              f"{imported_rows / elapsed:.0f} rows/s")
+            flush(conn)
+            conn.commit()
+            for path in large_files:
+                import_large_file(conn, path)
+                elapsed = time.perf_counter() - started
+                print(f"{imported_files}/{len(files)} files, {imported_rows} rows, "
+                      f"{imported_rows / elapsed:.0f} rows/s")
+    finally:
+        # Without these the sidebar and thread loading fall back to full
+        # scans, so they go back even if the load stopped part way
+        print("Rebuilding indexes...")
+        index_started = time.perf_counter()
+        with engine.begin() as conn:
+            execute_script(conn, INDEXES_DDL)
+        index_seconds = time.perf_counter() - index_started
+
+    elapsed = time.perf_counter() - started
+    print(f"Imported {imported_files} files, {imported_rows} rows in {elapsed:.2f}s "
+          f"({imported_rows / elapsed:.0f} rows/s, index rebuild {index_seconds:.2f}s)")
+    for path, error in failed:
+        print(f"Skipped {path}: {error}")
+    return imported_rows
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Import legacy chat_history.json files into chainlit_db.db",
+        epilog="Example: python import_history.py old_deployments/ --user test --workers 8",
+    )
+    parser.add_argument("paths", nargs="+", help="History files or directories of *.json files")
+    parser.add_argument("--database", default="chainlit_db.db")
+    parser.add_argument("--user", default="test", help="Identifier of the user the threads belong to")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Number of parsing processes (default: CPU count)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not import_files(args.paths, args.database, args.user, args.workers):
+        sys.exit(1)
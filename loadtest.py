@@ -0,0 +1,149 @@
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import statistics
+import multiprocessing
+
+import httpx
+import socketio
+from aiohttp import web
+
+# Tokens and delay of the stand-in Ollama server, roughly a small local model
+FAKE_REPLY_TOKENS = 200
+FAKE_TOKEN_DELAY_S = 0.005
+
+
+async def fake_ollama_chat(request):
+    """Minimal /api/chat that streams a fixed reply, so the test measures the app, not the model."""
+    payload = await request.json()
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+    for i in range(FAKE_REPLY_TOKENS):
+        chunk = {"model": payload.get("model"), "message": {"role": "assistant", "content": f"tok{i} "}, "done": False}
+        await response.write((json.dumps(chunk) + "\n").encode())
+        await asyncio.sleep(FAKE_TOKEN_DELAY_S)
+    done = {"model": payload.get("model"), "message": {"role": "assistant", "content": ""}, "done": True,
+            "eval_count": FAKE_REPLY_TOKENS, "eval_duration": int(FAKE_REPLY_TOKENS * FAKE_TOKEN_DELAY_S * 1e9)}
+    await response.write((json.dumps(done) + "\n").encode())
+    await response.write_eof()
+    return response
+
+
+def run_fake_ollama(port):
+    app = web.Application()
+    app.router.add_post("/api/chat", fake_ollama_chat)
+    web.run_app(app, host="127.0.0.1", port=port, print=None)
+
+
+async def login(base_url, username, password):
+    """Return the Cookie header of an authenticated browser."""
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        response = await client.post("/login", data={"username": username, "password": password})
+        response.raise_for_status()
+        return "; ".join(f"{name}={value}" for name, value in client.cookies.items())
+
+
+async def run_session(base_url, username, password, question):
+    """Log in as a fresh browser, ask one question and wait for the full reply.
+
+    Each session logs in separately so it gets its own worker affinity
+    cookie, like distinct users would. Returns (seconds, streamed_tokens).
+    """
+    sio = socketio.AsyncClient(reconnection=False)
+    task_ends = asyncio.Queue()
+    tokens = 0
+
+    @sio.on("stream_token")
+    async def on_token(data):
+        nonlocal tokens
+        tokens += 1
+
+    @sio.on("task_end")
+    async def on_task_end(*args):
+        task_ends.put_nowait(time.perf_counter())
+
+    session_id = str(uuid.uuid4())
+    thread_id = str(uuid.uuid4())
+    started = time.perf_counter()
+    cookie = await login(base_url, username, password)
+    await sio.connect(
+        base_url,
+        socketio_path="/ws/socket.io",
+        transports=["websocket"],
+        headers={"Cookie": cookie},
+        auth={"clientType": "webapp", "sessionId": session_id, "threadId": thread_id, "userEnv": "{}"},
+    )
+    try:
+        await sio.emit("connection_successful")
+        # One task_end for the connection itself, one when on_chat_start is done
+        for _ in range(2):
+            await task_ends.get()
+        message = {
+            "id": str(uuid.uuid4()),
+            "threadId": thread_id,
+            "name": "test",
+            "type": "user_message",
+            "output": question,
+            "createdAt": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+        }
+        await sio.emit("client_message", {"message": message, "fileReferences": []})
+        await task_ends.get()
+    finally:
+        await sio.disconnect()
+    return time.perf_counter() - started, tokens
+
+
+async def run_load(base_url, sessions, concurrency, username, password, question):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited():
+        async with semaphore:
+            return await run_session(base_url, username, password, question)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(limited() for _ in range(sessions)), return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    ok = [r for r in results if not isinstance(r, Exception)]
+    return elapsed, ok, len(results) - len(ok)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Measure concurrent streaming chat sessions against a running server",
+        epilog="Example: python loadtest.py --sessions 200 --concurrency 50 --fake-ollama 11435",
+    )
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=25)
+    parser.add_argument("--username", default="test")
+    parser.add_argument("--password", default="test")
+    parser.add_argument("--question", default="Summarise the document in two sentences.")
+    parser.add_argument("--fake-ollama", type=int, metavar="PORT",
+                        help="Also run a stand-in Ollama server on this port "
+                             "(start the app with CHAT_BACKEND=ollama OLLAMA_BASE_URL=http://127.0.0.1:PORT)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    fake = None
+    if args.fake_ollama:
+        fake = multiprocessing.Process(target=run_fake_ollama, args=(args.fake_ollama,), daemon=True)
+        fake.start()
+        time.sleep(1)
+    try:
+        elapsed, ok, failed = asyncio.run(
+            run_load(args.url, args.sessions, args.concurrency, args.username, args.password, args.question)
+        )
+    finally:
+        if fake is not None:
+            fake.terminate()
+
+    print(f"{len(ok)} sessions in {elapsed:.1f}s ({len(ok) / elapsed:.1f} sessions/s), {failed} failed")
+    if ok:
+        latencies = sorted(seconds for seconds, _ in ok)
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1]
+        print(f"Latency p50 {statistics.median(latencies):.2f}s, p95 {p95:.2f}s, "
+              f"{sum(tokens for _, tokens in ok) / len(ok):.0f} streamed tokens per session")
@@ -0,0 +1,72 @@
+import os
+import json
+import time
+import argparse
+import threading
+from collections import deque
+from pathlib import Path
+
+# Every recorded event is appended here as one JSON object per line so it can
+# be inspected with standard tools (tail, jq) while the server is running.
+METRICS_PATH = Path("metrics.jsonl")
+# Set by serve.py so events from different worker processes can be told apart
+WORKER_ID = os.environ.get("AUTHORSHIP_WORKER_ID", "0")
+
+_recent = deque(maxlen=1000)
+_lock = threading.Lock()
+
+
+def record(event, **fields):
+    """Record a metrics event in memory and append it to METRICS_PATH."""
+    entry = {"ts": round(time.time(), 3), "worker": WORKER_ID, "event": event, **fields}
+    with _lock:
+        _recent.append(entry)
+        with open(METRICS_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+    return entry
+
+
+def recent(event=None, limit=100):
+    """Return the most recent in-memory events, optionally filtered by name."""
+    with _lock:
+        entries = [e for e in _recent if event is None or e["event"] == event]
+    return entries[-limit:]
+
+
+def latest_session_sweeps(path=METRICS_PATH):
+    """The last session_sweep event of each worker in a metrics file."""
+    latest = {}
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if '"session_sweep"' in line:
+                    entry = json.loads(line)
+                    latest[entry["worker"]] = entry
+    return latest
+
+
+def print_sessions(path=METRICS_PATH):
+    now = time.time()
+    for worker, sweep in sorted(latest_session_sweeps(path).items()):
+        print(f"worker {worker}, swept {now - sweep['ts']:.0f}s ago, "
+              f"RSS {sweep['rss_after_mb']} MB, {sweep['sessions']} sessions")
+        print(f"  {'session':<38}{'messages':>9}{'bytes':>10}{'on disk':>10}{'idle s':>8}")
+        rows = sorted(sweep.get("per_session", []), key=lambda s: s["bytes"], reverse=True)
+        for row in rows:
+            idle = f"{now - row['last_activity']:.0f}" if row["last_activity"] else "-"
+            print(f"  {row['session_id']:<38}{row['messages']:>9}{row['bytes']:>10}"
+                  f"{row['stored_bytes']:>10}{idle:>8}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Inspect recorded metrics")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    sessions = subparsers.add_parser("sessions", help="Per-session memory use from each worker's latest sweep")
+    sessions.add_argument("--path", type=Path, default=METRICS_PATH)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "sessions":
+        print_sessions(args.path)
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+
+import httpx
+
+import metrics
+
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+# How long Ollama keeps the model (and its KV cache) loaded after a request.
+DEFAULT_KEEP_ALIVE = "30m"
+# Must stay constant between turns: changing num_ctx makes Ollama reload the
+# model, which throws the cached prefix away.
+DEFAULT_NUM_CTX = 8192
+
+ROLES = {"system": "system", "human": "user", "ai": "assistant"}
+
+# Messages exactly as sent on a session's previous turn, plus the reply, by
+# session id. Kept outside OllamaChat because the runnables are rebuilt on
+# every settings change and after an idle offload (session_store.py), and
+# shared by the models of auto mode so the prefix stays the same whichever
+# model answers.
+transcripts = {}
+_client = None
+
+
+def http_client():
+    """One connection pool per process instead of a new client every turn."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(timeout=None)
+    return _client
+
+
+def to_ollama_message(message):
+    return {"role": ROLES.get(message.type, "user"), "content": message.content}
+
+
+def timings_from_response(data):
+    """Turn the duration fields of Ollama's final response into milliseconds."""
+    ns_to_ms = 1e-6
+    prompt_tokens = data.get("prompt_eval_count", 0)
+    prompt_ms = data.get("prompt_eval_duration", 0) * ns_to_ms
+    gen_tokens = data.get("eval_count", 0)
+    gen_ms = data.get("eval_duration", 0) * ns_to_ms
+    return {
+        "prompt_eval_tokens": prompt_tokens,
+        "prompt_eval_ms": round(prompt_ms, 1),
+        "eval_tokens": gen_tokens,
+        "eval_ms": round(gen_ms, 1),
+        "load_ms": round(data.get("load_duration", 0) * ns_to_ms, 1),
+        "total_ms": round(data.get("total_duration", 0) * ns_to_ms, 1),
+        "tokens_per_sec": round(gen_tokens / (gen_ms / 1000), 2) if gen_ms else None,
+    }
+
+
+class OllamaChat:
+    """Streams chat completions from Ollama's native /api/chat endpoint.
+
+    Ollama reuses its KV cache for the longest prefix of the prompt that
+    matches the previous request, so this adapter resends the exact messages
+    it sent last turn (including any retrieved context that was added to
+    earlier questions) followed by the new question. The memory only holds
+    the bare questions, so rebuilding the prompt from it would change an
+    earlier message and force the whole conversation to be evaluated again.
+    """
+
+    def __init__(self, model, session_id, base_url=OLLAMA_BASE_URL, keep_alive=DEFAULT_KEEP_ALIVE,
+                 num_ctx=DEFAULT_NUM_CTX, temperature=None):
+        self.model = model
+        self.session_id = session_id
+        self.url = base_url.rstrip("/") + "/api/chat"
+        self.keep_alive = keep_alive
+        self.options = {"num_ctx": num_ctx}
+        if temperature is not None:
+            self.options["temperature"] = temperature
+
+    def _stable_messages(self, messages):
+        rendered = [to_ollama_message(m) for m in messages]
+        history = rendered[:-1]
+        transcript = transcripts.get(self.session_id, [])
+        # Reuse the transcript if it is the same conversation as the history:
+        # same roles, and each sent message ends with the stored one (the
+        # sent version may carry a retrieved-context prefix).
+        if len(transcript) == len(history) and all(
+            sent["role"] == stored["role"] and sent["content"].endswith(stored["content"])
+            for sent, stored in zip(transcript, history)
+        ):
+            return transcript + rendered[-1:]
+        return rendered
+
+    async def astream(self, inputs):
+        """Async generator usable with RunnableGenerator: prompt values in, tokens out."""
+        prompt_value = None
+        async for value in inputs:
+            prompt_value = value
+        messages = self._stable_messages(prompt_value.to_messages())
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": True,
+            "keep_alive": self.keep_alive,
+            "options": self.options,
+        }
+
+        reply = []
+        final = {}
+        started = time.perf_counter()
+        async with http_client().stream("POST", self.url, json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                token = data.get("message", {}).get("content", "")
+                if token:
+                    reply.append(token)
+                    yield token
+                if data.get("done"):
+                    final = data
+
+        transcripts[self.session_id] = messages + [{"role": "assistant", "content": "".join(reply)}]
+        metrics.record(
+            "llm_turn",
+            backend="ollama",
+            model=self.model,
+            prompt_messages=len(messages),
+            prompt_chars=sum(len(m["content"]) for m in messages),
+            wall_ms=round((time.perf_counter() - started) * 1000, 1),
+            **timings_from_response(final),
+        )
@@ -0,0 +1,33 @@
+// Older messages of a reopened thread arrive as previews ending in a
+// "Show full message" link (see CachedDataLayer.get_thread). Clicking the
+// link fetches that step and replaces the preview with its full text.
+const FULL_STEP_LINK = "#full-step-";
+
+document.addEventListener("click", async (event) => {
+    const link = event.target.closest && event.target.closest(`a[href*="${FULL_STEP_LINK}"]`);
+    if (!link) {
+        return;
+    }
+    // Capture phase, so the link never navigates or opens a new tab
+    event.preventDefault();
+    event.stopPropagation();
+
+    const match = window.location.pathname.match(/^(.*)\/thread\/([^/]+)/);
+    if (!match) {
+        return;
+    }
+    const [, rootPath, threadId] = match;
+    const stepId = link.getAttribute("href").split(FULL_STEP_LINK)[1];
+    const response = await fetch(`${rootPath}/project/thread/${threadId}/step/${stepId}`, {
+        credentials: "include",
+    });
+    if (!response.ok) {
+        link.textContent = "Couldn't load the full message";
+        return;
+    }
+    const step = await response.json();
+    const full = document.createElement("div");
+    full.style.whiteSpace = "pre-wrap";
+    full.textContent = step.output || "";
+    (link.closest(".prose") || link.parentElement).replaceChildren(full);
+}, true);
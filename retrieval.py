@@ -0,0 +1,344 @@
+import io
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import hashlib
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+# Where per-thread indexes live. Each thread gets its own directory holding
+# the vector matrix, the chunk texts and the offsets that tie the two together.
+INDEX_ROOT = Path("rag_index")
+
+EMBEDDING_DIM = 384
+CHUNK_CHARS = 1200
+CHUNK_OVERLAP = 200
+READ_BLOCK_CHARS = 64 * 1024
+EMBED_BATCH = 512
+# How many rows of the memory-mapped matrix are scored at a time during a query.
+# Keeps the working set bounded no matter how large the index grows.
+QUERY_BLOCK_ROWS = 65536
+DEFAULT_TOP_K = 4
+# Chunks with a larger share of U+FFFD are undecodable binary, not text worth
+# retrieving.
+MAX_REPLACEMENT_RATIO = 0.1
+# Uploads with other mime types are not ingested; an empty mime is let through
+# and left to the replacement character check.
+TEXT_MIME_TYPES = ("text/", "application/json", "application/xml", "application/javascript",
+                   "application/x-yaml", "application/yaml", "application/x-sh", "application/sql")
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def embed_texts(texts):
+    """Embed a batch of texts into L2-normalised float32 vectors.
+
+    Uses the hashing trick over unigrams and bigrams so embedding stays local,
+    dependency-free and fast enough to ingest hundreds of thousands of chunks.
+    """
+    vectors = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        tokens = TOKEN_RE.findall(text.lower())
+        features = tokens + [a + " " + b for a, b in zip(tokens, tokens[1:])]
+        for feature in features:
+            h = zlib.crc32(feature.encode("utf-8"))
+            # The top bit picks the sign so that collisions tend to cancel out
+            sign = 1.0 if h & 0x80000000 else -1.0
+            vectors[row, h % EMBEDDING_DIM] += sign
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def is_text_mime(mime):
+    return not mime or mime.startswith(TEXT_MIME_TYPES)
+
+
+def _is_text(chunk):
+    return chunk.strip() and chunk.count("\ufffd") <= len(chunk) * MAX_REPLACEMENT_RATIO
+
+
+def iter_chunks(path, chunk_chars=CHUNK_CHARS, overlap=CHUNK_OVERLAP):
+    """Yield overlapping text chunks from a file without reading it all at once.
+
+    Chunks that are mostly undecodable bytes are skipped.
+    """
+    with open(path, "rb") as raw:
+        # Decode incrementally; binary or oddly encoded uploads degrade to
+        # replacement characters instead of failing the whole ingestion.
+        stream = io.TextIOWrapper(raw, encoding="utf-8", errors="replace")
+        buffer = ""
+        while True:
+            block = stream.read(READ_BLOCK_CHARS)
+            if not block:
+                break
+            buffer += block
+            while len(buffer) >= chunk_chars:
+                chunk = buffer[:chunk_chars]
+                if _is_text(chunk):
+                    yield chunk
+                buffer = buffer[chunk_chars - overlap:]
+        if _is_text(buffer):
+            yield buffer
+
+
+class VectorIndex:
+    """Append-only vector index backed by flat files and a NumPy memmap.
+
+    Layout of the index directory:
+      vectors.f32  - row-major float32 matrix, EMBEDDING_DIM columns
+      chunks.bin   - JSON records ({"source", "text"}) written back to back
+      offsets.u64  - (offset, length) pairs into chunks.bin, one per row
+      files.txt    - SHA-256 of every file ingested, one per line
+      pending      - row count from before the file currently being ingested
+
+    Opening the index (and starting a file) trims whatever an interrupted
+    append or ingestion left behind, so all three data files agree again.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.directory / "vectors.f32"
+        self.chunks_path = self.directory / "chunks.bin"
+        self.offsets_path = self.directory / "offsets.u64"
+        self.files_path = self.directory / "files.txt"
+        self.pending_path = self.directory / "pending"
+        for path in (self.vectors_path, self.chunks_path, self.offsets_path, self.files_path):
+            path.touch(exist_ok=True)
+        self.recover()
+
+    def __len__(self):
+        return self.offsets_path.stat().st_size // 16
+
+    def recover(self):
+        """Drop rows of an unfinished ingestion and any half-written append."""
+        if self.pending_path.exists():
+            rows = int(self.pending_path.read_text() or 0)
+        else:
+            rows = min(len(self), self.vectors_path.stat().st_size // (EMBEDDING_DIM * 4))
+        rows = min(rows, len(self))
+        chunks_end = 0
+        if rows:
+            offset, length = self._open_offsets(rows)[rows - 1]
+            chunks_end = int(offset + length)
+        for path, size in ((self.offsets_path, rows * 16),
+                           (self.vectors_path, rows * EMBEDDING_DIM * 4),
+                           (self.chunks_path, chunks_end)):
+            if path.stat().st_size > size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+        self.pending_path.unlink(missing_ok=True)
+
+    def begin_file(self):
+        self.recover()
+        self.pending_path.write_text(str(len(self)))
+
+    def end_file(self, digest):
+        self.add_file(digest)
+        self.pending_path.unlink(missing_ok=True)
+
+    def append(self, sources, texts, vectors):
+        """Append a batch of chunks and their vectors to the end of the index."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        offsets = np.empty((len(texts), 2), dtype=np.uint64)
+        position = self.chunks_path.stat().st_size
+        records = []
+        for i, (source, text) in enumerate(zip(sources, texts)):
+            record = json.dumps({"source": source, "text": text}).encode("utf-8")
+            offsets[i] = (position, len(record))
+            position += len(record)
+            records.append(record)
+
+        # The offsets define the row count and are written last, so a crash
+        # mid-append never leaves a row referencing missing data; extra
+        # chunk bytes or vector rows are trimmed by recover().
+        with open(self.chunks_path, "ab") as f:
+            f.write(b"".join(records))
+        with open(self.vectors_path, "ab") as f:
+            f.write(vectors.tobytes())
+        with open(self.offsets_path, "ab") as f:
+            f.write(offsets.tobytes())
+
+    def has_file(self, digest):
+        with open(self.files_path, encoding="ascii") as f:
+            return any(line.strip() == digest for line in f)
+
+    def add_file(self, digest):
+        with open(self.files_path, "a", encoding="ascii") as f:
+            f.write(digest + "\n")
+
+    def _open_vectors(self, rows):
+        return np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, EMBEDDING_DIM))
+
+    def _open_offsets(self, rows):
+        return np.memmap(self.offsets_path, dtype=np.uint64, mode="r", shape=(rows, 2))
+
+    def get_chunk(self, row):
+        offset, length = self._open_offsets(len(self))[row]
+        with open(self.chunks_path, "rb") as f:
+            f.seek(int(offset))
+            return json.loads(f.read(int(length)))
+
+    def search(self, query_vector, k=DEFAULT_TOP_K):
+        """Return up to k (score, row) pairs, best first."""
+        rows = len(self)
+        if rows == 0:
+            return []
+        vectors = self._open_vectors(rows)
+        best_scores = np.empty(0, dtype=np.float32)
+        best_rows = np.empty(0, dtype=np.int64)
+        for start in range(0, rows, QUERY_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + QUERY_BLOCK_ROWS])
+            scores = block @ query_vector
+            take = min(k, len(scores))
+            top = np.argpartition(-scores, take - 1)[:take]
+            best_scores = np.concatenate([best_scores, scores[top]])
+            best_rows = np.concatenate([best_rows, top + start])
+            # Only the running top-k across blocks needs to be kept
+            if len(best_scores) > k:
+                keep = np.argpartition(-best_scores, k - 1)[:k]
+                best_scores, best_rows = best_scores[keep], best_rows[keep]
+        order = np.argsort(-best_scores)
+        return [(float(best_scores[i]), int(best_rows[i])) for i in order]
+
+
+def index_for_thread(thread_id):
+    return VectorIndex(INDEX_ROOT / str(thread_id))
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def ingest_file(index, path, source=None):
+    """Stream a file through chunking and embedding into the index.
+
+    Files whose content is already in the index are skipped. Returns the
+    number of chunks added.
+    """
+    source = source or os.path.basename(path)
+    digest = file_digest(path)
+    if index.has_file(digest):
+        return 0
+    # Until end_file, the rows added here are rolled back by recover(), so an
+    # interrupted ingestion can simply be repeated without duplicating chunks.
+    index.begin_file()
+    added = 0
+    batch = []
+    try:
+        for chunk in iter_chunks(path):
+            batch.append(chunk)
+            if len(batch) >= EMBED_BATCH:
+                index.append([source] * len(batch), batch, embed_texts(batch))
+                added += len(batch)
+                batch = []
+        if batch:
+            index.append([source] * len(batch), batch, embed_texts(batch))
+            added += len(batch)
+    except BaseException:
+        index.recover()
+        raise
+    index.end_file(digest)
+    return added
+
+
+def retrieve(index, query, k=DEFAULT_TOP_K):
+    """Return the top-k chunk records for a query as a list of dicts."""
+    if len(index) == 0 or not query.strip():
+        return []
+    query_vector = embed_texts([query])[0]
+    return [index.get_chunk(row) for _, row in index.search(query_vector, k)]
+
+
+def format_context(chunks):
+    """Render retrieved chunks as a prompt prefix, or "" when nothing matched."""
+    if not chunks:
+        return ""
+    parts = [f"[{c['source']}]\n{c['text'].strip()}" for c in chunks]
+    return "Relevant excerpts from uploaded files:\n\n" + "\n\n---\n\n".join(parts) + "\n\nQuestion: "
+
+
+def benchmark(num_chunks, directory, k=DEFAULT_TOP_K, queries=50):
+    """Measure ingestion throughput and query latency on a synthetic corpus."""
+    import tempfile
+
+    index = VectorIndex(directory)
+    # Start from an empty index so repeated runs measure the same amount of work
+    for path in (index.vectors_path, index.chunks_path, index.offsets_path, index.files_path):
+        path.write_bytes(b"")
+
+    # Synthetic corpus written to disk so ingestion goes through the same
+    # streaming path as real uploads.
+    rng = np.random.default_rng(0)
+    vocabulary = np.array([f"term{i}" for i in range(20000)])
+    words_per_chunk = CHUNK_CHARS // 8
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, encoding="utf-8") as f:
+        corpus_path = f.name
+        for _ in range(num_chunks):
+            words = rng.choice(vocabulary, size=words_per_chunk)
+            f.write((" ".join(words) + " ").ljust(CHUNK_CHARS - CHUNK_OVERLAP)[:CHUNK_CHARS - CHUNK_OVERLAP])
+
+    try:
+        start = time.perf_counter()
+        added = ingest_file(index, corpus_path, source="bench")
+        ingest_seconds = time.perf_counter() - start
+    finally:
+        os.unlink(corpus_path)
+
+    latencies = []
+    for _ in range(queries):
+        query = " ".join(rng.choice(vocabulary, size=8))
+        start = time.perf_counter()
+        retrieve(index, query, k)
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+
+    print(f"Chunks indexed:      {added}")
+    print(f"Ingestion time:      {ingest_seconds:.2f}s ({added / ingest_seconds:.0f} chunks/s)")
+    index_bytes = sum(p.stat().st_size for p in (index.vectors_path, index.chunks_path, index.offsets_path))
+    print(f"Index size on disk:  {index_bytes / 1e6:.1f} MB")
+    print(f"Query latency (ms):  p50={np.percentile(latencies, 50):.1f} p95={np.percentile(latencies, 95):.1f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Local retrieval index for uploaded files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest = subparsers.add_parser("ingest", help="Add files to an index directory")
+    ingest.add_argument("index_dir")
+    ingest.add_argument("files", nargs="+")
+
+    query = subparsers.add_parser("query", help="Print the top-k chunks for a query")
+    query.add_argument("index_dir")
+    query.add_argument("text")
+    query.add_argument("-k", type=int, default=DEFAULT_TOP_K)
+
+    bench = subparsers.add_parser("bench", help="Benchmark ingestion and query latency")
+    bench.add_argument("--chunks", type=int, default=100000)
+    bench.add_argument("--index-dir", default="rag_index_bench")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "ingest":
+        index = VectorIndex(args.index_dir)
+        for path in args.files:
+            print(f"{path}: {ingest_file(index, path)} chunks")
+    elif args.command == "query":
+        for chunk in retrieve(VectorIndex(args.index_dir), args.text, args.k):
+            print(f"--- {chunk['source']}\n{chunk['text']}\n")
+    elif args.command == "bench":
+        benchmark(args.chunks, args.index_dir)
+    else:
+        sys.exit(1)
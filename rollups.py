@@ -0,0 +1,356 @@
+import time
+import asyncio
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, text
+
+DB_URL = "sqlite:///chainlit_db.db?timeout=30"
+REFRESH_INTERVAL_SECONDS = 60
+
+engine = create_engine(DB_URL)
+# Not chainlit.logger: importing that writes a .chainlit/ config into the
+# working directory, and create_schema.py / import_history.py import this
+logger = logging.getLogger(__name__)
+
+# Columns shared by the change log and both rollup tables
+MEASURES = ["steps", "messages", "replies", "replyChars", "errors", "feedbackUp", "feedbackDown"]
+
+ROLLUP_DDL = [
+    # Signed contributions written by the triggers below: +1 for a new row,
+    # -1 for the previous version of an updated or deleted one. Summing the
+    # changes past the watermark gives the delta to add to the rollups.
+    """CREATE TABLE IF NOT EXISTS rollup_changes (
+        "seq" INTEGER PRIMARY KEY AUTOINCREMENT,
+        "day" TEXT,
+        "threadId" UUID,
+        "userId" UUID,
+        "model" TEXT,
+        "steps" INT NOT NULL DEFAULT 0,
+        "messages" INT NOT NULL DEFAULT 0,
+        "replies" INT NOT NULL DEFAULT 0,
+        "replyChars" INT NOT NULL DEFAULT 0,
+        "errors" INT NOT NULL DEFAULT 0,
+        "feedbackUp" INT NOT NULL DEFAULT 0,
+        "feedbackDown" INT NOT NULL DEFAULT 0
+    )""",
+    """CREATE TABLE IF NOT EXISTS rollup_state (
+        "id" INTEGER PRIMARY KEY CHECK ("id" = 1),
+        "watermark" INTEGER NOT NULL,
+        "refreshedAt" TEXT
+    )""",
+    """INSERT OR IGNORE INTO rollup_state ("id", "watermark") VALUES (1, 0)""",
+    """CREATE TABLE IF NOT EXISTS usage_daily_user (
+        "day" TEXT NOT NULL,
+        "userId" UUID NOT NULL,
+        "steps" INT NOT NULL DEFAULT 0,
+        "messages" INT NOT NULL DEFAULT 0,
+        "replies" INT NOT NULL DEFAULT 0,
+        "replyChars" INT NOT NULL DEFAULT 0,
+        "errors" INT NOT NULL DEFAULT 0,
+        "feedbackUp" INT NOT NULL DEFAULT 0,
+        "feedbackDown" INT NOT NULL DEFAULT 0,
+        PRIMARY KEY ("day", "userId")
+    )""",
+    """CREATE TABLE IF NOT EXISTS usage_daily_model (
+        "day" TEXT NOT NULL,
+        "model" TEXT NOT NULL,
+        "steps" INT NOT NULL DEFAULT 0,
+        "messages" INT NOT NULL DEFAULT 0,
+        "replies" INT NOT NULL DEFAULT 0,
+        "replyChars" INT NOT NULL DEFAULT 0,
+        "errors" INT NOT NULL DEFAULT 0,
+        "feedbackUp" INT NOT NULL DEFAULT 0,
+        "feedbackDown" INT NOT NULL DEFAULT 0,
+        PRIMARY KEY ("day", "model")
+    )""",
+]
+
+ROLLUP_TABLES = {"usage_daily_user": "userId", "usage_daily_model": "model"}
+TRIGGER_NAMES = [
+    "rollup_steps_insert", "rollup_steps_update", "rollup_steps_delete",
+    "rollup_feedbacks_insert", "rollup_feedbacks_update", "rollup_feedbacks_delete",
+]
+
+
+def _model_of(step):
+    # Replies carry the model that wrote them in their metadata (see app.py).
+    # json_valid keeps a malformed metadata value from failing the write.
+    return f"""CASE WHEN json_valid({step}."metadata") THEN json_extract({step}."metadata", '$.model') END"""
+
+
+def _step_change(row, sign, with_ratings=True):
+    """Select list of a step's contribution; row is NEW, OLD or a table alias.
+
+    Ratings already attached to the step are part of it, so when a step's day
+    or model changes its ratings move with it. A step that is only now being
+    inserted can't have been rated yet, which spares the insert trigger two
+    lookups in feedbacks (unindexed while import_history.py runs).
+    """
+    if with_ratings:
+        ratings = f"""
+        {sign} * (SELECT COUNT(*) FROM feedbacks WHERE "forId" = {row}."id" AND "value" = 1),
+        {sign} * (SELECT COUNT(*) FROM feedbacks WHERE "forId" = {row}."id" AND "value" = 0)"""
+    else:
+        ratings = "0, 0"
+    return f"""
+        substr({row}."createdAt", 1, 10), {row}."threadId",
+        (SELECT "userId" FROM threads WHERE "id" = {row}."threadId"), {_model_of(row)},
+        {sign},
+        {sign} * ({row}."type" = 'user_message'),
+        {sign} * ({row}."type" = 'assistant_message'),
+        {sign} * (CASE WHEN {row}."type" = 'assistant_message' THEN length(COALESCE({row}."output", '')) ELSE 0 END),
+        {sign} * (COALESCE({row}."isError", 0) != 0),
+        {ratings}"""
+
+
+def _feedback_change(row, sign):
+    """Contribution of a rating, counted on the day and model of the rated step (alias s)."""
+    return f"""
+        substr(s."createdAt", 1, 10), s."threadId", t."userId", {_model_of("s")},
+        0, 0, 0, 0, 0,
+        {sign} * ({row}."value" = 1),
+        {sign} * ({row}."value" = 0)"""
+
+
+def _rated_step(row):
+    return f'FROM steps s LEFT JOIN threads t ON t."id" = s."threadId" WHERE s."id" = {row}."forId"'
+
+
+CHANGE_COLUMNS = '"day", "threadId", "userId", "model", ' + ", ".join(f'"{m}"' for m in MEASURES)
+INSERT_CHANGE = f"INSERT INTO rollup_changes ({CHANGE_COLUMNS}) SELECT"
+
+# Only columns that feed the rollups; Chainlit rewrites steps several times
+# while a message is produced.
+STEP_COLUMNS_CHANGED = " OR ".join(
+    f'OLD."{c}" IS NOT NEW."{c}"' for c in ["type", "output", "isError", "metadata", "createdAt", "threadId"]
+)
+
+TRIGGERS_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS rollup_steps_insert AFTER INSERT ON steps BEGIN
+        {INSERT_CHANGE} {_step_change("NEW", 1, with_ratings=False)};
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS rollup_steps_update AFTER UPDATE ON steps
+    WHEN {STEP_COLUMNS_CHANGED} BEGIN
+        {INSERT_CHANGE} {_step_change("OLD", -1)};
+        {INSERT_CHANGE} {_step_change("NEW", 1)};
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS rollup_steps_delete AFTER DELETE ON steps BEGIN
+        {INSERT_CHANGE} {_step_change("OLD", -1)};
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS rollup_feedbacks_insert AFTER INSERT ON feedbacks BEGIN
+        {INSERT_CHANGE} {_feedback_change("NEW", 1)} {_rated_step("NEW")};
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS rollup_feedbacks_update AFTER UPDATE ON feedbacks
+    WHEN OLD."value" IS NOT NEW."value" OR OLD."forId" IS NOT NEW."forId" BEGIN
+        {INSERT_CHANGE} {_feedback_change("OLD", -1)} {_rated_step("OLD")};
+        {INSERT_CHANGE} {_feedback_change("NEW", 1)} {_rated_step("NEW")};
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS rollup_feedbacks_delete AFTER DELETE ON feedbacks BEGIN
+        {INSERT_CHANGE} {_feedback_change("OLD", -1)} {_rated_step("OLD")};
+    END""",
+]
+
+# Existing rows enter the change log once, when the triggers are installed.
+# Ratings come along with their steps.
+BACKFILL = f"{INSERT_CHANGE} {_step_change('st', 1)} FROM steps st"
+
+_refresher_task = None
+
+
+def install(conn):
+    """Create the rollup tables and triggers. Returns False if the chat tables don't exist yet."""
+    existing = {name: sql for name, sql in conn.execute(text("SELECT name, sql FROM sqlite_master"))}
+    if not {"steps", "feedbacks", "threads"} <= existing.keys():
+        return False
+    for stmt in ROLLUP_DDL:
+        conn.execute(text(stmt))
+    # SQLite stores trigger definitions without the IF NOT EXISTS
+    outdated = [
+        name for name, stmt in zip(TRIGGER_NAMES, TRIGGERS_DDL)
+        if name in existing and existing[name] != stmt.replace(" IF NOT EXISTS", "", 1)
+    ]
+    if outdated and set(TRIGGER_NAMES) <= existing.keys():
+        # Triggers from an earlier version: the rollups are still valid,
+        # only the way future changes are logged differs
+        for name, stmt in zip(TRIGGER_NAMES, TRIGGERS_DDL):
+            if name in outdated:
+                conn.execute(text(f'DROP TRIGGER "{name}"'))
+                conn.execute(text(stmt))
+    elif not set(TRIGGER_NAMES) <= existing.keys():
+        # Without all triggers the rollups can't be trusted: start over from
+        # the raw tables. Same transaction as the backfill, so no row is
+        # counted twice or missed.
+        for name in TRIGGER_NAMES:
+            conn.execute(text(f'DROP TRIGGER IF EXISTS "{name}"'))
+        for table in ["rollup_changes", *ROLLUP_TABLES]:
+            conn.execute(text(f"DELETE FROM {table}"))
+        conn.execute(text("""UPDATE rollup_state SET "watermark" = 0"""))
+        for stmt in TRIGGERS_DDL:
+            conn.execute(text(stmt))
+        conn.execute(text(BACKFILL))
+    return True
+
+
+def refresh(conn):
+    """Fold the changes past the watermark into the rollup tables. Returns the number applied."""
+    # Writing first takes the database write lock, so refreshes running in
+    # several workers queue up instead of applying the same changes twice.
+    conn.execute(
+        text("""UPDATE rollup_state SET "refreshedAt" = :now"""),
+        {"now": datetime.now(timezone.utc).isoformat()},
+    )
+    low = conn.execute(text("""SELECT "watermark" FROM rollup_state""")).scalar()
+    high = conn.execute(text("""SELECT COALESCE(MAX("seq"), 0) FROM rollup_changes""")).scalar()
+    if high <= low:
+        return 0
+
+    sums = ", ".join(f'SUM(c."{m}")' for m in MEASURES)
+    updates = ", ".join(f'"{m}" = "{m}" + excluded."{m}"' for m in MEASURES)
+    columns = ", ".join(f'"{m}"' for m in MEASURES)
+    keys = {
+        # Steps written before their thread had an owner pick it up here
+        "userId": 'COALESCE(c."userId", t."userId")',
+        "model": 'c."model"',
+    }
+    for table, key in ROLLUP_TABLES.items():
+        conn.execute(
+            text(f"""
+                INSERT INTO {table} ("day", "{key}", {columns})
+                SELECT c."day", {keys[key]} AS k, {sums}
+                FROM rollup_changes c LEFT JOIN threads t ON t."id" = c."threadId"
+                WHERE c."seq" > :low AND c."seq" <= :high AND c."day" IS NOT NULL AND k IS NOT NULL
+                GROUP BY c."day", k
+                ON CONFLICT ("day", "{key}") DO UPDATE SET {updates}
+            """),
+            {"low": low, "high": high},
+        )
+    conn.execute(text("""DELETE FROM rollup_changes WHERE "seq" <= :high"""), {"high": high})
+    conn.execute(text("""UPDATE rollup_state SET "watermark" = :high"""), {"high": high})
+    return high - low
+
+
+def rebuild(conn):
+    """Recompute the rollups from the raw tables, e.g. after restoring a backup."""
+    for name in TRIGGER_NAMES:
+        conn.execute(text(f'DROP TRIGGER IF EXISTS "{name}"'))
+    install(conn)
+    return refresh(conn)
+
+
+def _since(days):
+    return (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+
+
+def usage_by_user(conn, days=7, user=None):
+    """Per-user daily message counts, average reply length and error rate."""
+    query = """
+        SELECT r."day", COALESCE(u."identifier", r."userId") AS user, r."messages", r."replies",
+               CAST(r."replyChars" AS REAL) / NULLIF(r."replies", 0) AS avg_reply_chars,
+               CAST(r."errors" AS REAL) / NULLIF(r."steps", 0) AS error_rate,
+               r."feedbackUp", r."feedbackDown"
+        FROM usage_daily_user r LEFT JOIN users u ON u."id" = r."userId"
+        WHERE r."day" >= :since
+    """
+    parameters = {"since": _since(days)}
+    if user:
+        query += """ AND u."identifier" = :user"""
+        parameters["user"] = user
+    query += """ ORDER BY r."day" DESC, r."messages" DESC"""
+    return [dict(row._mapping) for row in conn.execute(text(query), parameters)]
+
+
+def usage_by_model(conn, days=30):
+    """Per-model totals over the last `days` days, including the share of positive ratings."""
+    return [
+        dict(row._mapping)
+        for row in conn.execute(
+            text("""
+                SELECT "model", SUM("replies") AS replies,
+                       CAST(SUM("replyChars") AS REAL) / NULLIF(SUM("replies"), 0) AS avg_reply_chars,
+                       CAST(SUM("errors") AS REAL) / NULLIF(SUM("steps"), 0) AS error_rate,
+                       SUM("feedbackUp") AS feedback_up, SUM("feedbackDown") AS feedback_down,
+                       CAST(SUM("feedbackUp") AS REAL) / NULLIF(SUM("feedbackUp") + SUM("feedbackDown"), 0) AS approval
+                FROM usage_daily_model
+                WHERE "day" >= :since
+                GROUP BY "model"
+                ORDER BY replies DESC
+            """),
+            {"since": _since(days)},
+        )
+    ]
+
+
+def refresh_database():
+    with engine.begin() as conn:
+        return refresh(conn) if install(conn) else 0
+
+
+async def _refresh_forever():
+    while True:
+        await asyncio.sleep(REFRESH_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(refresh_database)
+        except Exception:
+            logger.exception("Rollup refresh failed")
+
+
+def start_refresher():
+    """Keep the rollups current in the background, once per process."""
+    global _refresher_task
+    if _refresher_task is None or _refresher_task.done():
+        _refresher_task = asyncio.get_running_loop().create_task(_refresh_forever())
+
+
+def _format(value):
+    if isinstance(value, float):
+        return f"{value:.3f}" if value < 1 else f"{value:.0f}"
+    return "-" if value is None else str(value)
+
+
+def print_table(rows):
+    if not rows:
+        print("No data")
+        return
+    headers = list(rows[0])
+    cells = [[_format(row[h]) for h in headers] for row in rows]
+    widths = [max(len(h), *(len(c[i]) for c in cells)) for i, h in enumerate(headers)]
+    print("  ".join(h.ljust(w) for h, w in zip(headers, widths)))
+    for c in cells:
+        print("  ".join(v.ljust(w) for v, w in zip(c, widths)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Daily usage and feedback rollups",
+        epilog="Example: python rollups.py users --days 7",
+    )
+    parser.add_argument("command", choices=["refresh", "rebuild", "users", "models"])
+    parser.add_argument("--days", type=int, default=None, help="Report window (users: 7, models: 30)")
+    parser.add_argument("--user", help="Only this user identifier")
+    parser.add_argument("--database", default=DB_URL)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.database != DB_URL:
+        engine = create_engine(args.database)
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        if not install(conn):
+            raise SystemExit("Chat tables not found; run create_schema.py first")
+        if args.command == "rebuild":
+            applied = rebuild(conn)
+        else:
+            applied = refresh(conn)
+    refreshed = time.perf_counter()
+
+    with engine.connect() as conn:
+        if args.command == "users":
+            print_table(usage_by_user(conn, args.days or 7, args.user))
+        elif args.command == "models":
+            print_table(usage_by_model(conn, args.days or 30))
+    print(f"Applied {applied} changes in {(refreshed - started) * 1000:.1f} ms, "
+          f"query took {(time.perf_counter() - refreshed) * 1000:.1f} ms")
@@ -0,0 +1,115 @@
+import time
+import random
+import threading
+
+import metrics
+
+AUTO = "auto"
+SMALL_MODEL = "llama3.2:3b"
+LARGE_MODEL = "llama3.1:8b"
+MODEL_CHOICES = [AUTO, LARGE_MODEL, SMALL_MODEL]
+
+# Questions up to this many characters are treated as simple and always go to
+# the small model.
+SIMPLE_PROMPT_CHARS = 280
+# Rough reply length used to turn tokens/sec into a predicted answer time.
+EXPECTED_REPLY_TOKENS = 250
+# Rough size of a token in English text, to estimate the prompt's token count
+CHARS_PER_TOKEN = 4
+DEFAULT_LATENCY_BUDGET_S = 30
+
+# Starting guesses for CPU inference of a Q4 model on a recent laptop,
+# replaced by live measurements as soon as each model has answered a few
+# questions. With these a long question to the large model predicts about
+# 20 s, inside the default budget.
+PRIOR_TOKENS_PER_SEC = {SMALL_MODEL: 25.0, LARGE_MODEL: 14.0}
+# Prompt evaluation (time to first token) runs much faster per token than
+# generation. Earlier turns are in Ollama's prompt cache, so only the new
+# question has to be evaluated.
+PRIOR_PROMPT_TOKENS_PER_SEC = {SMALL_MODEL: 150.0, LARGE_MODEL: 60.0}
+# Weight given to the newest measurement in the moving average
+SPEED_SMOOTHING = 0.3
+# Very short replies are dominated by prompt evaluation and skew the average
+MIN_TOKENS_FOR_SAMPLE = 8
+# A model with no sample this recent gets EXPLORE_RATE of the long questions
+# it would otherwise lose, so an estimate that is too pessimistic can recover.
+STALE_SAMPLE_S = 600
+EXPLORE_RATE = 0.1
+
+_tokens_per_sec = dict(PRIOR_TOKENS_PER_SEC)
+_prompt_tokens_per_sec = dict(PRIOR_PROMPT_TOKENS_PER_SEC)
+# model -> time.monotonic() of its last speed sample
+_sampled_at = {}
+_lock = threading.Lock()
+
+
+def tokens_per_sec(model):
+    with _lock:
+        return _tokens_per_sec.get(model, PRIOR_TOKENS_PER_SEC[LARGE_MODEL])
+
+
+def prompt_tokens_per_sec(model):
+    with _lock:
+        return _prompt_tokens_per_sec.get(model, PRIOR_PROMPT_TOKENS_PER_SEC[LARGE_MODEL])
+
+
+def predict_seconds(model, question):
+    """Expected time to answer: evaluating the question plus generating a reply."""
+    prompt_tokens = len(question) / CHARS_PER_TOKEN
+    return prompt_tokens / prompt_tokens_per_sec(model) + EXPECTED_REPLY_TOKENS / tokens_per_sec(model)
+
+
+def _smooth(averages, model, sample):
+    previous = averages.get(model, sample)
+    averages[model] = previous + SPEED_SMOOTHING * (sample - previous)
+    return averages[model]
+
+
+def observe(model, tokens, seconds, prompt_chars=0, prompt_seconds=0):
+    """Fold measured generation and prompt evaluation speeds into the model's moving averages."""
+    if tokens < MIN_TOKENS_FOR_SAMPLE or seconds <= 0:
+        return
+    sample = tokens / seconds
+    prompt_sample = None
+    if prompt_chars and prompt_seconds > 0:
+        prompt_sample = prompt_chars / CHARS_PER_TOKEN / prompt_seconds
+    with _lock:
+        average = _smooth(_tokens_per_sec, model, sample)
+        if prompt_sample is not None:
+            _smooth(_prompt_tokens_per_sec, model, prompt_sample)
+        prompt_average = _prompt_tokens_per_sec.get(model)
+        _sampled_at[model] = time.monotonic()
+    metrics.record("model_speed", model=model, tokens=tokens, seconds=round(seconds, 3),
+                   tokens_per_sec=round(sample, 2), average_tokens_per_sec=round(average, 2),
+                   prompt_tokens_per_sec=round(prompt_sample, 2) if prompt_sample else None,
+                   average_prompt_tokens_per_sec=round(prompt_average, 2) if prompt_average else None)
+
+
+def _is_stale(model):
+    with _lock:
+        sampled_at = _sampled_at.get(model)
+    return sampled_at is None or time.monotonic() - sampled_at > STALE_SAMPLE_S
+
+
+def choose_model(question, budget_s=DEFAULT_LATENCY_BUDGET_S):
+    """Pick the local model for a question in auto mode and record why."""
+    predicted_s = {m: predict_seconds(m, question) for m in (SMALL_MODEL, LARGE_MODEL)}
+    if len(question) <= SIMPLE_PROMPT_CHARS:
+        model, reason = SMALL_MODEL, "simple_prompt"
+    elif _is_stale(LARGE_MODEL) and predicted_s[LARGE_MODEL] > budget_s and random.random() < EXPLORE_RATE:
+        model, reason = LARGE_MODEL, "explore"
+    elif predicted_s[LARGE_MODEL] <= budget_s:
+        model, reason = LARGE_MODEL, "within_budget"
+    elif predicted_s[SMALL_MODEL] < predicted_s[LARGE_MODEL]:
+        model, reason = SMALL_MODEL, "large_over_budget"
+    else:
+        model, reason = LARGE_MODEL, "no_faster_model"
+    metrics.record(
+        "route",
+        model=model,
+        reason=reason,
+        prompt_chars=len(question),
+        budget_s=budget_s,
+        predicted_s={m: round(s, 2) for m, s in predicted_s.items()},
+    )
+    return model
@@ -0,0 +1,216 @@
+import os
+import sys
+import time
+import sqlite3
+import asyncio
+import argparse
+import itertools
+import subprocess
+
+from aiohttp import web, ClientConnectorError, ClientSession, ClientTimeout, WSMsgType
+
+# The browser is pinned to one worker by this cookie. Chainlit keeps each
+# socket.io session (and uploads addressed to it) in the memory of the
+# process that created it, so every request from that browser has to land
+# on the same worker.
+AFFINITY_COOKIE = "authorship_worker"
+BASE_WORKER_PORT = 8100
+DB_PATH = "chainlit_db.db"
+
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "host",
+}
+# Restart backoff doubles on consecutive crashes up to this many seconds
+MAX_RESTART_DELAY = 30
+# A worker that stayed up this long is considered healthy again
+STABLE_AFTER_SECONDS = 60
+
+
+def prepare_database(path=DB_PATH):
+    # WAL lets the workers read while one of them writes; the setting is
+    # stored in the database file, so it only needs to be applied once.
+    with sqlite3.connect(path) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+
+
+class Worker:
+    def __init__(self, index, port, app_path):
+        self.index = index
+        self.port = port
+        self.app_path = app_path
+        self.process = None
+        self.started_at = 0
+        self.failures = 0
+        self.restart_at = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        env = {**os.environ, "AUTHORSHIP_WORKER_ID": str(self.index)}
+        command = [sys.executable, "-m", "chainlit", "run", self.app_path, "--headless",
+                   "--host", "127.0.0.1", "--port", str(self.port)]
+        self.process = subprocess.Popen(command, env=env)
+        self.started_at = time.time()
+        print(f"Worker {self.index} started on port {self.port} (pid {self.process.pid})")
+
+    def stop(self):
+        if self.alive:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class Supervisor:
+    def __init__(self, num_workers, app_path):
+        self.workers = [Worker(i, BASE_WORKER_PORT + i, app_path) for i in range(num_workers)]
+        self._next = itertools.cycle(range(num_workers))
+        self.session = None
+
+    def pick_worker(self, request):
+        """Return (worker, is_new_assignment) for a request."""
+        cookie = request.cookies.get(AFFINITY_COOKIE)
+        if cookie is not None and cookie.isdigit() and int(cookie) < len(self.workers):
+            worker = self.workers[int(cookie)]
+            if worker.alive:
+                return worker, False
+        # New browser, or its worker is down: round-robin over live workers
+        for _ in range(len(self.workers)):
+            worker = self.workers[next(self._next)]
+            if worker.alive:
+                return worker, True
+        raise web.HTTPServiceUnavailable(text="No workers available")
+
+    async def watch(self):
+        """Restart crashed workers with exponential backoff."""
+        while True:
+            now = time.time()
+            for worker in self.workers:
+                if worker.alive:
+                    if worker.failures and now - worker.started_at > STABLE_AFTER_SECONDS:
+                        worker.failures = 0
+                    continue
+                if worker.restart_at == 0:
+                    code = worker.process.returncode if worker.process else None
+                    delay = min(MAX_RESTART_DELAY, 2 ** worker.failures)
+                    worker.failures += 1
+                    worker.restart_at = now + delay
+                    print(f"Worker {worker.index} exited with code {code}; restarting in {delay}s")
+                elif now >= worker.restart_at:
+                    worker.restart_at = 0
+                    worker.start()
+            await asyncio.sleep(1)
+
+    async def handle(self, request):
+        worker, is_new = self.pick_worker(request)
+        try:
+            if request.headers.get("Upgrade", "").lower() == "websocket":
+                return await self.proxy_websocket(request, worker)
+            return await self.proxy_http(request, worker, is_new)
+        except ClientConnectorError:
+            # Worker process is up but not listening yet (still starting)
+            raise web.HTTPBadGateway(text=f"Worker {worker.index} is not ready")
+
+    def forward_headers(self, request):
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+        headers["X-Forwarded-For"] = request.remote or ""
+        headers["X-Forwarded-Host"] = request.host
+        return headers
+
+    async def proxy_http(self, request, worker, is_new):
+        async with self.session.request(
+            request.method,
+            worker.url + request.rel_url.raw_path_qs,
+            headers=self.forward_headers(request),
+            data=request.content if request.body_exists else None,
+            allow_redirects=False,
+        ) as upstream:
+            response = web.StreamResponse(status=upstream.status, reason=upstream.reason)
+            for key, value in upstream.headers.items():
+                if key.lower() not in HOP_BY_HOP_HEADERS:
+                    response.headers.add(key, value)
+            if is_new:
+                response.set_cookie(AFFINITY_COOKIE, str(worker.index), httponly=True, samesite="Lax")
+            await response.prepare(request)
+            # Stream through so token streams and large downloads aren't buffered
+            async for chunk in upstream.content.iter_any():
+                await response.write(chunk)
+            await response.write_eof()
+            return response
+
+    async def proxy_websocket(self, request, worker):
+        client_ws = web.WebSocketResponse(autoping=True)
+        await client_ws.prepare(request)
+        headers = {k: v for k, v in self.forward_headers(request).items()
+                   if not k.lower().startswith("sec-websocket")}
+        async with self.session.ws_connect(
+            "ws://127.0.0.1:%d%s" % (worker.port, request.rel_url.raw_path_qs), headers=headers
+        ) as worker_ws:
+
+            async def pump(source, target):
+                async for msg in source:
+                    if msg.type == WSMsgType.TEXT:
+                        await target.send_str(msg.data)
+                    elif msg.type == WSMsgType.BINARY:
+                        await target.send_bytes(msg.data)
+                    else:
+                        break
+
+            tasks = [asyncio.create_task(pump(client_ws, worker_ws)),
+                     asyncio.create_task(pump(worker_ws, client_ws))]
+            # When either side goes away, tear down the other
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in tasks:
+                task.cancel()
+        await client_ws.close()
+        return client_ws
+
+    async def on_startup(self, app):
+        # auto_decompress=False passes compressed bodies through untouched
+        self.session = ClientSession(auto_decompress=False, timeout=ClientTimeout(total=None))
+        for worker in self.workers:
+            worker.start()
+        app["watcher"] = asyncio.create_task(self.watch())
+
+    async def on_cleanup(self, app):
+        app["watcher"].cancel()
+        await self.session.close()
+        for worker in self.workers:
+            worker.stop()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Run several Chainlit workers behind a sticky-session proxy",
+        epilog="Example: python serve.py --workers 4 --port 8000",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--app", default="app.py")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    prepare_database()
+    supervisor = Supervisor(args.workers, args.app)
+    app = web.Application(client_max_size=0)
+    app.router.add_route("*", "/{path:.*}", supervisor.handle)
+    app.on_startup.append(supervisor.on_startup)
+    app.on_cleanup.append(supervisor.on_cleanup)
+    # run_app turns SIGINT/SIGTERM into a clean shutdown, which stops the
+    # workers through on_cleanup
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import gc
+import os
+import sys
+import json
+import time
+import zlib
+import asyncio
+import threading
+from pathlib import Path
+
+from chainlit.logger import logger
+from chainlit.user_session import user_sessions
+from langchain.memory import ConversationBufferMemory
+from langchain_core.messages import messages_from_dict, messages_to_dict
+
+import metrics
+import ollama_chat
+
+# Conversation memory of idle sessions is written here, one file per session.
+# Each worker process (see serve.py) gets its own directory since sessions
+# never move between workers and each sweep prunes files it doesn't know.
+STORE_DIR = Path("session_store") / os.environ.get("AUTHORSHIP_WORKER_ID", "0")
+IDLE_SECONDS = 15 * 60
+SWEEP_INTERVAL_SECONDS = 60
+
+# Session keys that hold (or reference) the conversation memory. The
+# runnables close over memory.load_memory_variables, so they have to go too.
+OFFLOADED_KEYS = ("memory", "runnables")
+
+# Message counts of offloaded sessions, by session id. Kept out of the user
+# session itself: Chainlit persists that dict into the thread metadata and
+# copies it into the next session when the thread is resumed.
+_offloaded = {}
+# Held while a memory moves to or from disk, since sweeps run in a thread
+_lock = threading.Lock()
+_sweeper_task = None
+
+
+def current_rss_bytes():
+    """Resident set size of this process, or None if it can't be determined."""
+    if sys.platform.startswith("linux"):
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+        return None
+    return None
+
+
+def release_freed_memory():
+    # glibc keeps freed small allocations in its heap; ask it to hand them back
+    # to the OS so the drop shows up in RSS. Other platforms do this on their own.
+    if sys.platform.startswith("linux"):
+        import ctypes
+
+        try:
+            ctypes.CDLL("libc.so.6").malloc_trim(0)
+        except OSError:
+            pass
+
+
+def _store_path(session_id):
+    return STORE_DIR / f"{session_id}.json.z"
+
+
+def touch(session):
+    session["last_activity"] = time.time()
+
+
+def memory_stats(session_id, session):
+    """Messages, approximate content bytes in memory, bytes on disk and last activity for one session."""
+    memory = session.get("memory")
+    stored_bytes = 0
+    if memory is not None:
+        messages = memory.chat_memory.messages
+        num_messages = len(messages)
+        num_bytes = sum(len(str(m.content).encode("utf-8")) for m in messages)
+    else:
+        num_messages = _offloaded.get(session_id, 0)
+        num_bytes = 0
+        if session_id in _offloaded:
+            path = _store_path(session_id)
+            stored_bytes = path.stat().st_size if path.exists() else 0
+    return {
+        "session_id": session_id,
+        "messages": num_messages,
+        "bytes": num_bytes,
+        "stored_bytes": stored_bytes,
+        "last_activity": session.get("last_activity"),
+        "offloaded": session_id in _offloaded,
+    }
+
+
+def offload(session_id, session):
+    """Write a session's memory, and its Ollama transcript, to disk and drop them.
+
+    Returns the number of compressed bytes written.
+    """
+    memory = session.get("memory")
+    if memory is None:
+        return 0
+    messages = memory.chat_memory.messages
+    stored = {
+        "messages": messages_to_dict(messages),
+        # Restored on rehydrate so the next prompt still matches Ollama's cache
+        "transcript": ollama_chat.transcripts.pop(session_id, None),
+    }
+    payload = zlib.compress(json.dumps(stored).encode("utf-8"))
+    STORE_DIR.mkdir(parents=True, exist_ok=True)
+    _store_path(session_id).write_bytes(payload)
+
+    for key in OFFLOADED_KEYS:
+        session.pop(key, None)
+    _offloaded[session_id] = len(messages)
+    return len(payload)
+
+
+def rehydrate(session_id, session):
+    """Reload an offloaded memory into the session. Returns True if it did."""
+    with _lock:
+        if session_id not in _offloaded:
+            return False
+        path = _store_path(session_id)
+        memory = ConversationBufferMemory(return_messages=True)
+        if path.exists():
+            stored = json.loads(zlib.decompress(path.read_bytes()))
+            memory.chat_memory.messages = messages_from_dict(stored["messages"])
+            if stored["transcript"] is not None:
+                ollama_chat.transcripts[session_id] = stored["transcript"]
+            path.unlink()
+        session["memory"] = memory
+        del _offloaded[session_id]
+    return True
+
+
+def sweep(idle_seconds=IDLE_SECONDS):
+    """Offload every session idle longer than idle_seconds and report memory use.
+
+    The session_sweep event carries one memory_stats row per session, taken
+    after the offload; `python metrics.py sessions` prints the latest ones.
+    """
+    now = time.time()
+    sessions = list(user_sessions.items())
+    idle = [
+        (session_id, s) for session_id, s in sessions
+        if s.get("memory") is not None and now - s.get("last_activity", now) > idle_seconds
+    ]
+
+    rss_before = current_rss_bytes()
+    written = 0
+    for session_id, s in idle:
+        with _lock:
+            # The session may have become active since the list was made
+            if time.time() - s.get("last_activity", now) > idle_seconds:
+                written += offload(session_id, s)
+    if idle:
+        gc.collect()
+        release_freed_memory()
+    rss_after = current_rss_bytes()
+
+    # Stored memories of sessions Chainlit has already cleaned up
+    for session_id in list(_offloaded):
+        if session_id not in user_sessions:
+            _offloaded.pop(session_id, None)
+    for session_id in list(ollama_chat.transcripts):
+        if session_id not in user_sessions:
+            ollama_chat.transcripts.pop(session_id, None)
+    if STORE_DIR.exists():
+        for path in STORE_DIR.glob("*.json.z"):
+            if path.name[: -len(".json.z")] not in user_sessions:
+                path.unlink(missing_ok=True)
+
+    with _lock:
+        stats = [memory_stats(session_id, s) for session_id, s in sessions if session_id in user_sessions]
+    metrics.record(
+        "session_sweep",
+        sessions=len(stats),
+        resident_sessions=sum(1 for s in stats if not s["offloaded"]),
+        resident_messages=sum(s["messages"] for s in stats if not s["offloaded"]),
+        resident_bytes=sum(s["bytes"] for s in stats),
+        stored_bytes=sum(s["stored_bytes"] for s in stats),
+        offloaded_now=len(idle),
+        offloaded_bytes_written=written,
+        rss_before_mb=round(rss_before / 2**20, 1) if rss_before else None,
+        rss_after_mb=round(rss_after / 2**20, 1) if rss_after else None,
+        per_session=stats,
+    )
+
+
+async def _sweep_forever():
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL_SECONDS)
+        # Serialising and compressing memories would stall token streaming
+        # if it ran on the event loop
+        try:
+            await asyncio.to_thread(sweep)
+        except Exception:
+            logger.exception("Idle session sweep failed")
+
+
+def start_sweeper():
+    """Start the background sweep once per process."""
+    global _sweeper_task
+    if _sweeper_task is None or _sweeper_task.done():
+        _sweeper_task = asyncio.get_running_loop().create_task(_sweep_forever())
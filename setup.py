@@ -3,10 +3,27 @@ import subprocess
 import sys
 import venv
 import re
+import json
+import time
+import hashlib
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from enum import Enum, auto
 
+# Input hashes of completed steps, used by --provision to skip unchanged steps
+STATE_FILE = ".setup_state.json"
+WHEELHOUSE_DIR = "wheelhouse"
+# pip processes fetching/building wheels at the same time
+DEFAULT_WHEEL_JOBS = 8
+# Written inside the venv after every successful install: requirements hash
+# plus a unique install id. It disappears with the venv, and the executable's
+# inputs include it so a reinstall also forces a rebuild.
+REQUIREMENTS_MARKER = ".requirements_installed"
+# Files the executable is built from, besides the venv's REQUIREMENTS_MARKER
+EXECUTABLE_INPUTS = ["authorship.spec", "launcher.py", "favicon.ico", "requirements.txt"]
+PINNED_REQUIREMENT = re.compile(r"^([A-Za-z0-9][A-Za-z0-9._-]*)==([^\s;#]+)$")
+
 class SetupStep(Enum):
     CREATE_VENV = auto()
     INSTALL_REQUIREMENTS = auto()
@@ -65,10 +82,58 @@ def run_command(command, shell=True, show_output=False, activate_venv=False):
         print(f"Error output: {e.stderr}")
         sys.exit(1)
 
+def hash_files(paths):
+    """SHA-256 over the names and contents of the given files (missing files count as empty)"""
+    digest = hashlib.sha256(sys.version.encode())
+    for path in paths:
+        path = Path(path)
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes() if path.exists() else b"")
+    return digest.hexdigest()
+
+def normalize_name(name):
+    # Wheel file names use this form of the distribution name (PEP 427)
+    return re.sub(r"[-_.]+", "_", name).lower()
+
+def parse_requirements(path):
+    """Split a requirements file into pinned (name, version) pairs and any other lines"""
+    pinned, other = [], []
+    for line in Path(path).read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        match = PINNED_REQUIREMENT.match(line)
+        if match:
+            pinned.append((match.group(1), match.group(2)))
+        else:
+            other.append(line)
+    return pinned, other
+
+def wheels_in(wheelhouse):
+    """(normalized name, version) of every wheel in the wheelhouse"""
+    found = set()
+    for wheel in Path(wheelhouse).glob("*.whl"):
+        name, version = wheel.name.split("-")[:2]
+        found.add((normalize_name(name), version))
+    return found
+
 class Setup:
-    def __init__(self):
+    def __init__(self, provision=False, offline=False, force=False,
+                 wheelhouse=WHEELHOUSE_DIR, jobs=DEFAULT_WHEEL_JOBS):
         self.current_dir = Path.cwd()
         self.venv_dir = self.current_dir / "venv"
+        self.requirements_marker = self.venv_dir / REQUIREMENTS_MARKER
+        # Provisioning mode installs from a local wheelhouse, skips steps
+        # whose inputs are unchanged and keeps PyInstaller's build cache
+        self.provision = provision or offline
+        self.offline = offline
+        self.force = force
+        self.wheelhouse = self.current_dir / wheelhouse
+        self.jobs = jobs
+        self.state_path = self.current_dir / STATE_FILE
+        self.state = json.loads(self.state_path.read_text()) if self.state_path.exists() else {}
+        # Names of the steps that were skipped as up to date
+        self.skipped = set()
         
         # Set platform-specific paths
         if sys.platform == "win32":
@@ -80,18 +145,104 @@ class Setup:
             self.activate_script = self.venv_dir / "bin" / "activate"
             self.chainlit_path = self.venv_dir / "bin" / "chainlit"
 
+    def up_to_date(self, step, key, output):
+        """True if provisioning can skip a step: same inputs as last time and its output exists"""
+        if not self.provision or self.force or self.state.get(step) != key or not Path(output).exists():
+            return False
+        print(f"{step}: inputs unchanged, skipping")
+        self.skipped.add(step)
+        return True
+
+    def mark_done(self, step, key):
+        self.state[step] = key
+        self.state_path.write_text(json.dumps(self.state, indent=2))
+
     def create_venv(self):
         """Step 1: Create virtual environment"""
+        key = sys.version
+        if self.up_to_date("create_venv", key, self.python_path):
+            return
         print("Creating virtual environment...")
         venv.create(self.venv_dir, with_pip=True)
+        # Whatever was installed or built before belongs to the old venv
+        self.requirements_marker.unlink(missing_ok=True)
+        for step in ("install_requirements", "create_executable"):
+            self.state.pop(step, None)
+        self.mark_done("create_venv", key)
 
     def install_requirements(self):
         """Step 2: Install requirements"""
-        print("Installing requirements...")
-        run_command(f'"{self.python_path}" -m pip install -r requirements.txt', show_output=True)
+        key = hash_files(["requirements.txt"])
+        if not self.provision:
+            print("Installing requirements...")
+            run_command(f'"{self.python_path}" -m pip install -r requirements.txt', show_output=True)
+            self.write_requirements_marker(key)
+            return
+
+        if self.up_to_date("install_requirements", key, self.requirements_marker):
+            return
+        self.fill_wheelhouse()
+        print("Installing requirements from the wheelhouse...")
+        run_command(
+            f'"{self.python_path}" -m pip install --no-index --find-links "{self.wheelhouse}" -r requirements.txt',
+            show_output=True,
+        )
+        self.write_requirements_marker(key)
+        self.mark_done("install_requirements", key)
+
+    def write_requirements_marker(self, key):
+        self.requirements_marker.write_text(f"{key} {time.time_ns()}\n")
+
+    def fill_wheelhouse(self):
+        """Download or build a wheel for every requirement not already in the wheelhouse"""
+        self.wheelhouse.mkdir(exist_ok=True)
+        pinned, other = parse_requirements("requirements.txt")
+        have = wheels_in(self.wheelhouse)
+        missing = [f"{name}=={version}" for name, version in pinned
+                   if (normalize_name(name), version) not in have]
+        print(f"Wheelhouse: {len(pinned) - len(missing)} of {len(pinned)} pinned requirements cached")
+        if self.offline:
+            if missing or other:
+                print("Error: offline install needs these in the wheelhouse first:")
+                for requirement in missing + other:
+                    print(f"    {requirement}")
+                sys.exit(1)
+            return
+
+        # Every dependency is pinned in requirements.txt, so the wheels can be
+        # fetched independently (--no-deps) by several pip processes at once
+        batches = [missing[i::self.jobs] for i in range(self.jobs) if missing[i::self.jobs]]
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            for batch in pool.map(self.fetch_wheels, batches):
+                print(f"Fetched {', '.join(batch)}")
+        if other:
+            # Unpinned or URL requirements may pull in dependencies of their own
+            print("Fetching unpinned requirements...")
+            run_command(
+                f'"{self.python_path}" -m pip wheel --wheel-dir "{self.wheelhouse}" '
+                f'--find-links "{self.wheelhouse}" ' + " ".join(f'"{line}"' for line in other),
+                show_output=True,
+            )
+
+    def fetch_wheels(self, requirements):
+        run_command(f'"{self.python_path}" -m pip wheel --no-deps --wheel-dir "{self.wheelhouse}" '
+                    + " ".join(requirements))
+        return requirements
+
+    def existing_secret(self):
+        env_file = self.current_dir / ".env"
+        if not env_file.exists():
+            return None
+        match = re.search(r'CHAINLIT_AUTH_SECRET=["\'](.*)["\']', env_file.read_text())
+        return match.group(1) if match else None
 
     def create_chainlit_secret(self):
         """Step 3: Create Chainlit secret"""
+        # A new secret would log everyone out, so provisioning keeps the old one
+        if self.provision and not self.force and self.existing_secret():
+            print("create_chainlit_secret: .env already has a secret, keeping it")
+            self.skipped.add("create_chainlit_secret")
+            return self.existing_secret()
         print("Creating Chainlit secret...")
         chainlit_output = run_command(f'"{self.python_path}" -m chainlit create-secret')
         
@@ -104,6 +255,10 @@ class Setup:
 
     def create_env_file(self, chainlit_secret):
         """Step 4: Create .env file"""
+        if self.provision and not self.force and chainlit_secret == self.existing_secret():
+            print("create_env_file: .env is up to date, skipping")
+            self.skipped.add("create_env_file")
+            return
         print("Creating .env file...")
         env_content = f'''CHAINLIT_AUTH_SECRET="{chainlit_secret}"
 OPENAI_API_KEY="fake_key"
@@ -111,8 +266,17 @@ OPENAI_API_KEY="fake_key"
         with open(".env", "w") as f:
             f.write(env_content)
 
+    @property
+    def exe_path(self):
+        if sys.platform == "win32":
+            return self.current_dir / "dist" / "Authorship.exe"
+        return self.current_dir / "dist" / "Authorship"
+
     def create_executable(self):
         """Step 5: Create executable"""
+        if self.provision:
+            self.build_executable_incrementally()
+            return
         print("Creating executable...")
         try:
             # Ensure the dist directory exists and is empty
@@ -146,11 +310,7 @@ OPENAI_API_KEY="fake_key"
             run_command(command, show_output=True, activate_venv=True)
 
             # Verify the executable was created
-            if sys.platform == "win32":
-                exe_path = dist_dir / "Authorship.exe"
-            else:
-                exe_path = dist_dir / "Authorship"
-
+            exe_path = self.exe_path
             if not exe_path.exists():
                 print(f"Error: Executable was not created at expected path: {exe_path}")
                 sys.exit(1)
@@ -161,6 +321,35 @@ OPENAI_API_KEY="fake_key"
             print(f"Error creating executable: {str(e)}")
             sys.exit(1)
 
+    def build_executable_incrementally(self):
+        """Rebuild the executable only when its inputs changed, reusing PyInstaller's cache"""
+        key = hash_files(EXECUTABLE_INPUTS + [self.requirements_marker])
+        if self.up_to_date("create_executable", key, self.exe_path):
+            return
+        spec_file = self.current_dir / "authorship.spec"
+        if not spec_file.exists():
+            print(f"Error: Could not find spec file at {spec_file}")
+            sys.exit(1)
+
+        # No --clean and build/ is kept, so PyInstaller reuses its analysis
+        # and its cache of processed binaries; --noconfirm lets it replace
+        # the previous executable in dist/.
+        print("Running PyInstaller (incremental)...")
+        run_command(f'pyinstaller "{spec_file}" --noconfirm', show_output=True, activate_venv=True)
+        if not self.exe_path.exists():
+            print(f"Error: Executable was not created at expected path: {self.exe_path}")
+            sys.exit(1)
+        self.mark_done("create_executable", key)
+        print(f"Successfully created executable at: {self.exe_path}")
+
+    def print_timings(self, timings):
+        """Print how long each step took"""
+        print("\nStep timings:")
+        for step, seconds in timings:
+            note = "  (up to date)" if step in self.skipped else ""
+            print(f"  {step:<24}{seconds:8.1f}s{note}")
+        print(f"  {'total':<24}{sum(seconds for _, seconds in timings):8.1f}s")
+
     def print_final_instructions(self):
         """Print instructions for running the server"""
         print("\nSetup completed successfully!")
@@ -186,6 +375,10 @@ Examples:
     python setup.py --start-step install_requirements
     python setup.py --start-step create_chainlit_secret
 
+  Provision from a local wheelhouse, skipping steps whose inputs are unchanged:
+    python setup.py --provision
+    python setup.py --offline          (no network; wheelhouse/ must be complete)
+
 Available steps (in order):
   - create_venv
   - install_requirements
@@ -202,11 +395,33 @@ Available steps (in order):
         default='all',
         metavar='STEP'
     )
+    parser.add_argument(
+        '--provision',
+        action='store_true',
+        help='Install from a cached wheelhouse, skip up-to-date steps and build incrementally',
+    )
+    parser.add_argument(
+        '--offline',
+        action='store_true',
+        help='Like --provision, but never use the network',
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='With --provision, run every step even if its inputs are unchanged',
+    )
+    parser.add_argument('--wheelhouse', default=WHEELHOUSE_DIR, help='Wheel cache directory')
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=DEFAULT_WHEEL_JOBS,
+        help='Parallel pip processes when filling the wheelhouse',
+    )
     return parser.parse_args()
 
 def main():
     args = parse_args()
-    setup = Setup()
+    setup = Setup(args.provision, args.offline, args.force, args.wheelhouse, max(1, args.jobs))
     
     # Map steps to their corresponding functions
     steps = {
@@ -221,6 +436,7 @@ def main():
     start_step = SetupStep[args.start_step.upper()]
     should_run = False
     chainlit_secret = None
+    timings = []
     
     for step in SetupStep:
         if step == SetupStep.ALL:
@@ -230,14 +446,18 @@ def main():
             should_run = True
             
         if should_run:
-            if step == SetupStep.CREATE_ENV_FILE and chainlit_secret is None:
-                chainlit_secret = setup.create_chainlit_secret()
+            started = time.perf_counter()
+            if step == SetupStep.CREATE_ENV_FILE:
+                if chainlit_secret is None:
+                    chainlit_secret = setup.create_chainlit_secret()
                 setup.create_env_file(chainlit_secret)
             else:
                 result = steps[step]()
                 if step == SetupStep.CREATE_CHAINLIT_SECRET:
                     chainlit_secret = result
+            timings.append((step.name.lower(), time.perf_counter() - started))
     
+    setup.print_timings(timings)
     setup.print_final_instructions()
 
 if __name__ == "__main__":
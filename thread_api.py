@@ -0,0 +1,40 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse
+from starlette.middleware.gzip import GZipMiddleware
+
+from chainlit.data import get_data_layer
+from chainlit.data.acl import is_thread_author
+from chainlit.server import UserParam, app
+
+# Responses smaller than this aren't worth the CPU to compress
+GZIP_MINIMUM_BYTES = 1024
+
+router = APIRouter()
+
+
+@router.get("/project/thread/{thread_id}/step/{step_id}")
+async def get_thread_step(thread_id: str, step_id: str, current_user: UserParam):
+    """One step in full, for the "Show full message" links of older steps (see public/thread_loader.js)."""
+    data_layer = get_data_layer()
+    if not data_layer or not hasattr(data_layer, "get_step"):
+        raise HTTPException(status_code=400, detail="Loading single steps is not supported by the data layer")
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    await is_thread_author(current_user.identifier, thread_id)
+    step = await data_layer.get_step(thread_id, step_id)
+    if step is None:
+        raise HTTPException(status_code=404, detail="Step not found")
+    return JSONResponse(content=step)
+
+
+def install(*extra_routers):
+    """Register the routes and response compression on Chainlit's FastAPI app.
+
+    Must run at import time of the Chainlit module, before the server starts.
+    """
+    app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_BYTES)
+    # Chainlit ends its routes with a catch-all that serves the UI, so ours
+    # have to go in front of it to be reachable.
+    for extra in extra_routers:
+        app.router.routes[0:0] = extra.routes
+    app.router.routes[0:0] = router.routes